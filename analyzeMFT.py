@@ -1,12 +1,17 @@
 #!/usr/bin/python
 
+import sys
+
 try:
-    from analyzemft import mftsession
+    from analyzemft import mftmulti, mftsession
 except:
-    from .analyzemft import mftsession
+    from .analyzemft import mftmulti, mftsession
 
 if __name__ == "__main__":
     session = mftsession.MftSession()
     session.mft_options()
+    if session.options.batch is not None:
+        sys.exit(mftmulti.run_batch(session.options))
     session.open_files()
     session.process_mft_file()
+    session.close_files()
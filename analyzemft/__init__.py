@@ -1,5 +1,15 @@
-__all__ = ["mftutils", "mft", "mftsession", "bitparse"]
+__all__ = ["mftutils", "mft", "mftsession", "bitparse", "mftreader", "mftrecord", "mftbatch", "mftcache", "mftcolumns", "mftfilter", "mftmulti", "mftpaths", "mftpipeline", "mftstats"]
 import bitparse
 import mft
+import mftbatch
+import mftcache
+import mftcolumns
+import mftfilter
+import mftmulti
+import mftpaths
+import mftpipeline
+import mftreader
+import mftrecord
 import mftsession
+import mftstats
 import mftutils
@@ -11,63 +11,112 @@
 
 import binascii
 import json
-import ctypes
 import struct
+from array import array
 from optparse import OptionParser
 
-import bitparse
+import mftrecord
 import mftutils
 
+# Precompiled layouts of the fixed size on-disk structures, so each one is decoded with a single unpack_from.
+# Pad bytes ('x') skip the high bytes of fields that are only partially decoded.
+MFT_HEADER = struct.Struct("<IHHQHHHHIILxxHH2sI2s")  # FILE record header, up to and including the USN
+ATR_TYPE = struct.Struct("<L")
+ATR_TYPE_LEN = struct.Struct("<LL")
+ATR_HEADER = struct.Struct("<LLBBHHH")  # Common attribute header
+ATR_RESIDENT = struct.Struct("<LHBx")  # Follows the common header for resident attributes
+ATR_NONRESIDENT = struct.Struct("<QQHH4xQQQ")  # Follows the common header for non-resident attributes
+SI_ATTRIBUTE = struct.Struct("<LLLLLLLLIIIIIIQQ")
+FN_ATTRIBUTE = struct.Struct("<LxxHLLLLLLLLqqI4xBB")
+FN_NAME = struct.Struct("<L60xBB")  # Parent reference and name length/namespace of a FN attribute
+ATTRIBUTE_LIST = struct.Struct("<IHBBQLxxHH")
+VOLUME_INFO = struct.Struct("<QBBHI")
+UINT64 = struct.Struct("<Q")
+INT64 = struct.Struct("<q")
+
+# Padding that widens a short little endian run length or offset to 8 bytes, with sign extension for the offset
+ZERO_PAD = '\x00' * 8
+SIGN_PAD = '\xff' * 8
+
+# Run lengths and LCNs are kept in arrays of C longs where those are 64 bits. Elsewhere, as on Windows, doubles
+# hold them exactly up to 2**53 clusters.
+DATARUN_TYPECODE = 'l' if array('l').itemsize >= 8 else 'd'
+
+# LCN unpack_dataruns gives a sparse run. No real run starts at a negative cluster.
+SPARSE_LCN = -1
+
 
 def parse_record(raw_record, options):
-    record = {
-        'filename': '',
-        'notes': '',
-        'ads': 0,
-        'datacnt': 0,
-    }
+    (record, raw_record) = parse_record_header(raw_record, options)
+    if raw_record is not None:
+        parse_record_attributes(record, raw_record, options)
 
-    decode_mft_header(record, raw_record)
+    return record
 
-    # HACK: Apply the NTFS fixup on a 1024 byte record.
-    # Note that the fixup is only applied locally to this function.
-    if record['seq_number'] == raw_record[510:512] and record['seq_number'] == raw_record[1022:1024]:
-        raw_record = "%s%s%s%s" % (
-            raw_record[:510],
-            record['seq_attr1'],
-            raw_record[512:1022],
-            record['seq_attr2'],
-        )
 
-    record_number = record['recordnum']
+def parse_record_header(raw_record, options):
+    """Decode the header of a MFT record and apply the update sequence fixup
+
+    Returns the record and the fixed up raw record, or None in place of the raw record for BAAD and corrupt
+    records, which have no attributes to decode."""
+
+    record = mftrecord.MftRecord()
+
+    decode_mft_header(record, raw_record)
+
+    record_number = record.recordnum
 
     if options.debug:
         print '-->Record number: %d\n\tMagic: %s Attribute offset: %d Flags: %s Size:%d' % (
             record_number,
-            record['magic'],
-            record['attr_off'],
-            hex(int(record['flags'])),
-            record['size'],
+            record.magic,
+            record.attr_off,
+            hex(int(record.flags)),
+            record.size,
         )
 
-    if record['magic'] == 0x44414142:
+    if record.magic == 0x44414142:
         if options.debug:
             print "BAAD MFT Record"
-        record['baad'] = True
-        return record
+        record.baad = True
+        return record, None
 
-    if record['magic'] != 0x454c4946:
+    if record.magic != 0x454c4946:
         if options.debug:
             print "Corrupt MFT Record"
-        record['corrupt'] = True
-        return record
+        record.corrupt = True
+        return record, None
+
+    raw_record = apply_fixup(record, raw_record)
+    if hasattr(record, 'fixup_failed'):
+        if options.debug:
+            print "Update sequence fixup failed"
+        add_note(record, 'Fixup failed')
 
-    read_ptr = record['attr_off']
+    return record, raw_record
+
+
+def parse_record_attributes(record, raw_record, options):
+    """Decode the attributes of a record from parse_record_header, and run the anomaly checks
+
+    options.fields, when set, is the set of FIELDS the outputs need, see MftSession.output_fields. The others are skipped:
+    without 'fn_all' only the first $FILE_NAME attribute is decoded and counted in fncnt, and attributes whose
+    contents are not needed are noted as present with a value of None."""
+
+    fields = getattr(options, 'fields', None)
+    all_fn = fields is None or 'fn_all' in fields
+    decode_al = fields is None or 'al' in fields
+    decode_objid = fields is None or 'objid' in fields
+    decode_volinfo = fields is None or 'volinfo' in fields
+    decode_data = fields is None or 'data' in fields
+
+    read_ptr = record.attr_off
+    record_size = len(raw_record)
 
     # How should we preserve the multiple attributes? Do we need to preserve them all?
-    while read_ptr < 1024:
+    while read_ptr < record_size:
 
-        atr_record = decode_atr_header(raw_record[read_ptr:])
+        atr_record = decode_atr_header(raw_record, read_ptr, decode_data)
         if atr_record['type'] == 0xffffffff:  # End of attributes
             break
 
@@ -90,123 +139,132 @@ def parse_record(raw_record, options):
                     atr_record['nlen'],
                     atr_record['name_off'],
                 )
-            si_record = decode_si_attribute(raw_record[read_ptr + atr_record['soff']:], options.localtz)
-            record['si'] = si_record
+            si_record = decode_si_attribute(raw_record, options.localtz, read_ptr + atr_record['soff'])
+            record.si = si_record
             if options.debug:
                 print "++CRTime: %s\n++MTime: %s\n++ATime: %s\n++EntryTime: %s" % (
-                    si_record['crtime'].dtstr,
-                    si_record['mtime'].dtstr,
-                    si_record['atime'].dtstr,
-                    si_record['ctime'].dtstr,
+                    si_record.crtime.dtstr,
+                    si_record.mtime.dtstr,
+                    si_record.atime.dtstr,
+                    si_record.ctime.dtstr,
                 )
 
         elif atr_record['type'] == 0x20:  # Attribute list
             if options.debug:
                 print "Attribute list"
-            if atr_record['res'] == 0:
-                al_record = decode_attribute_list(raw_record[read_ptr + atr_record['soff']:], record)
-                record['al'] = al_record
+            if not decode_al:
+                record.al = None
+            elif atr_record['res'] == 0:
+                al_record = decode_attribute_list(raw_record, record, read_ptr + atr_record['soff'])
+                record.al = al_record
                 if options.debug:
                     print "Name: %s" % (al_record['name'])
             else:
                 if options.debug:
                     print "Non-resident Attribute List?"
-                record['al'] = None
+                record.al = None
 
         elif atr_record['type'] == 0x30:  # File name
             if options.debug:
                 print "File name record"
-            fn_record = decode_fn_attribute(raw_record[read_ptr + atr_record['soff']:], options.localtz, record)
-            record['fn', record['fncnt']] = fn_record
-            if options.debug:
-                print "Name: %s (%d)" % (fn_record['name'], record['fncnt'])
-            record['fncnt'] += 1
-            if fn_record['crtime'] != 0:
+            if all_fn or record.fncnt == 0:  # Otherwise only the first is needed
+                fn_record = decode_fn_attribute(raw_record, options.localtz, record, read_ptr + atr_record['soff'])
+                record['fn', record.fncnt] = fn_record
                 if options.debug:
-                    print "\tCRTime: %s MTime: %s ATime: %s EntryTime: %s" % (
-                        fn_record['crtime'].dtstr,
-                        fn_record['mtime'].dtstr,
-                        fn_record['atime'].dtstr,
-                        fn_record['ctime'].dtstr,
-                    )
+                    print "Name: %s (%d)" % (fn_record.name, record.fncnt)
+                record.fncnt += 1
+                if fn_record.crtime != 0:
+                    if options.debug:
+                        print "\tCRTime: %s MTime: %s ATime: %s EntryTime: %s" % (
+                            fn_record.crtime.dtstr,
+                            fn_record.mtime.dtstr,
+                            fn_record.atime.dtstr,
+                            fn_record.ctime.dtstr,
+                        )
 
         elif atr_record['type'] == 0x40:  # Object ID
-            object_id_record = decode_object_id(raw_record[read_ptr + atr_record['soff']:])
-            record['objid'] = object_id_record
+            if decode_objid:
+                record.objid = decode_object_id(raw_record, read_ptr + atr_record['soff'])
+            else:
+                record.objid = None
             if options.debug:
                 print "Object ID"
 
         elif atr_record['type'] == 0x50:  # Security descriptor
-            record['sd'] = True
+            record.sd = True
             if options.debug:
                 print "Security descriptor"
 
         elif atr_record['type'] == 0x60:  # Volume name
-            record['volname'] = True
+            record.volname = True
             if options.debug:
                 print "Volume name"
 
         elif atr_record['type'] == 0x70:  # Volume information
             if options.debug:
                 print "Volume info attribute"
-            volume_info_record = decode_volume_info(raw_record[read_ptr + atr_record['soff']:], options)
-            record['volinfo'] = volume_info_record
+            if decode_volinfo:
+                record.volinfo = decode_volume_info(raw_record, options, read_ptr + atr_record['soff'])
+            else:
+                record.volinfo = None
 
         elif atr_record['type'] == 0x80:  # Data
             if atr_record['name'] != '':
-                record['data_name', record['ads']] = atr_record['name']
-                record['ads'] += 1
-            if atr_record['res'] == 0:
-                data_attribute = decode_data_attribute(raw_record[read_ptr + atr_record['soff']:], atr_record)
+                record['data_name', record.ads] = atr_record['name']
+                record.ads += 1
+            if not decode_data:
+                data_attribute = None
+            elif atr_record['res'] == 0:
+                data_attribute = decode_data_attribute(raw_record, atr_record, read_ptr + atr_record['soff'])
             else:
                 data_attribute = {
                     'ndataruns': atr_record['ndataruns'],
                     'dataruns': atr_record['dataruns'],
                     'drunerror': atr_record['drunerror'],
                 }
-            record['data', record['datacnt']] = data_attribute
-            record['datacnt'] += 1
+            record['data', record.datacnt] = data_attribute
+            record.datacnt += 1
 
             if options.debug:
                 print "Data attribute"
 
         elif atr_record['type'] == 0x90:  # Index root
-            record['indexroot'] = True
+            record.indexroot = True
             if options.debug:
                 print "Index root"
 
         elif atr_record['type'] == 0xA0:  # Index allocation
-            record['indexallocation'] = True
+            record.indexallocation = True
             if options.debug:
                 print "Index allocation"
 
         elif atr_record['type'] == 0xB0:  # Bitmap
-            record['bitmap'] = True
+            record.bitmap = True
             if options.debug:
                 print "Bitmap"
 
         elif atr_record['type'] == 0xC0:  # Reparse point
-            record['reparsepoint'] = True
+            record.reparsepoint = True
             if options.debug:
                 print "Reparse point"
 
         elif atr_record['type'] == 0xD0:  # EA Information
-            record['eainfo'] = True
+            record.eainfo = True
             if options.debug:
                 print "EA Information"
 
         elif atr_record['type'] == 0xE0:  # EA
-            record['ea'] = True
+            record.ea = True
             if options.debug:
                 print "EA"
 
         elif atr_record['type'] == 0xF0:  # Property set
-            record['propertyset'] = True
+            record.propertyset = True
             if options.debug:
                 print "Property set"
 
         elif atr_record['type'] == 0x100:  # Logged utility stream
-            record['loggedutility'] = True
+            record.loggedutility = True
             if options.debug:
                 print "Logged utility stream"
 
@@ -227,6 +285,91 @@ def parse_record(raw_record, options):
     return record
 
 
+def parse_path_record(raw_record):
+    """Decode only the header and $FILE_NAME attributes of a MFT record
+
+    This is all build_filepaths needs, so the full parse_record only has to run once per record."""
+
+    record = mftrecord.MftRecord()
+
+    decode_mft_header(record, raw_record)
+
+    if record.magic != 0x454c4946:  # BAAD or corrupt, there are no attributes to look at
+        return record
+
+    raw_record = apply_fixup(record, raw_record)
+
+    read_ptr = record.attr_off
+    record_size = len(raw_record)
+
+    while read_ptr < record_size:
+        (atr_type, atr_len) = ATR_TYPE_LEN.unpack_from(raw_record, read_ptr)
+        if atr_type == 0xffffffff:  # End of attributes
+            break
+
+        if atr_type == 0x30:  # File name
+            soff = ATR_RESIDENT.unpack_from(raw_record, read_ptr + 16)[1]
+            record['fn', record.fncnt] = decode_fn_name(raw_record, read_ptr + soff)
+            record.fncnt += 1
+
+        if atr_len > 0:
+            read_ptr = read_ptr + atr_len
+        else:
+            break
+
+    return record
+
+
+def apply_fixup(record, raw_record):
+    """Apply the update sequence array fixup to a record and return the fixed up record
+
+    The last two bytes of each stride of the record, 512 bytes on current volumes, hold the update sequence number
+    and the real bytes are in the update sequence array. The stride is worked out from the record size and the
+    number of entries in the array, so any record size works. A bytearray is fixed up in place; anything else,
+    such as a read only view into the MFT file, is copied to a bytearray once. Strides that do not end in the
+    update sequence number are torn writes: they are left as they are and record.fixup_failed is set."""
+
+    upd_off = record.upd_off
+    strides = record.upd_cnt - 1
+    record_size = len(raw_record)
+
+    if strides < 1 or record_size % strides or upd_off + 2 * (strides + 1) > record_size:
+        record.fixup_failed = True
+        return raw_record
+
+    stride = record_size // strides
+    usn = raw_record[upd_off:upd_off + 2]
+    record.seq_number = usn
+
+    if not isinstance(raw_record, bytearray):
+        raw_record = bytearray(raw_record)
+
+    for end in xrange(stride, record_size + 1, stride):
+        upd_off += 2
+        if raw_record[end - 2:end] == usn:
+            raw_record[end - 2:end] = raw_record[upd_off:upd_off + 2]
+        else:
+            record.fixup_failed = True
+
+    return raw_record
+
+
+# The parts of a record that parse_record_attributes can leave out, and the ones each output reads. The header,
+# $STANDARD_INFORMATION, the first $FILE_NAME attribute and the ADS names are always decoded.
+#
+# fn_all   every $FILE_NAME attribute rather than only the first
+# al       the contents of the attribute list
+# objid    the object IDs
+# volinfo  the volume information
+# data     resident $DATA contents and dataruns
+FIELDS = frozenset(('fn_all', 'al', 'objid', 'volinfo', 'data'))
+
+CSV_FIELDS = frozenset(('fn_all', 'objid'))
+JSON_FIELDS = FIELDS
+BODY_FIELDS = frozenset()
+L2T_FIELDS = frozenset()
+
+
 def mft_to_csv(record, ret_header, options):
     """Return a MFT record in CSV format"""
 
@@ -249,47 +392,47 @@ def mft_to_csv(record, ret_header, options):
                       'Property Set', 'Logged Utility Stream', 'Log/Notes', 'STF FN Shift', 'uSec Zero', 'ADS']
         return csv_string
 
-    if 'baad' in record:
-        csv_string = ["%s" % record['recordnum'], "BAAD MFT Record"]
+    if hasattr(record, 'baad'):
+        csv_string = ["%s" % record.recordnum, "BAAD MFT Record"]
         return csv_string
 
-    csv_string = [record['recordnum'], decode_mft_magic(record), decode_mft_isactive(record),
+    csv_string = [record.recordnum, decode_mft_magic(record), decode_mft_isactive(record),
                   decode_mft_recordtype(record)]
 
-    if 'corrupt' in record:
-        tmp_string = ["%s" % record['recordnum'], "Corrupt", "Corrupt", "Corrupt MFT Record"]
+    if hasattr(record, 'corrupt'):
+        tmp_string = ["%s" % record.recordnum, "Corrupt", "Corrupt", "Corrupt MFT Record"]
         csv_string.extend(tmp_string)
         return csv_string
 
-    # tmp_string = ["%d" % record['lsn']]
+    # tmp_string = ["%d" % record.lsn]
     #        csv_string.extend(tmp_string)
-    tmp_string = ["%d" % record['seq']]
+    tmp_string = ["%d" % record.seq]
     csv_string.extend(tmp_string)
 
-    if record['fncnt'] > 0:
-        csv_string.extend([str(record['fn', 0]['par_ref']), str(record['fn', 0]['par_seq'])])
+    if record.fncnt > 0:
+        csv_string.extend([str(record.fn_attrs[0].par_ref), str(record.fn_attrs[0].par_seq)])
     else:
         csv_string.extend(['NoParent', 'NoParent'])
 
-    if record['fncnt'] > 0 and 'si' in record:
+    if record.fncnt > 0 and hasattr(record, 'si'):
         filename_buffer = [
-            record['filename'],
-            options.date_formatter(record['si']['crtime'].dtstr),
-            options.date_formatter(record['si']['mtime'].dtstr),
-            options.date_formatter(record['si']['atime'].dtstr),
-            options.date_formatter(record['si']['ctime'].dtstr),
-            options.date_formatter(record['fn', 0]['crtime'].dtstr),
-            options.date_formatter(record['fn', 0]['mtime'].dtstr),
-            options.date_formatter(record['fn', 0]['atime'].dtstr),
-            options.date_formatter(record['fn', 0]['ctime'].dtstr),
+            record.filename,
+            options.date_formatter(record.si.crtime.dtstr),
+            options.date_formatter(record.si.mtime.dtstr),
+            options.date_formatter(record.si.atime.dtstr),
+            options.date_formatter(record.si.ctime.dtstr),
+            options.date_formatter(record.fn_attrs[0].crtime.dtstr),
+            options.date_formatter(record.fn_attrs[0].mtime.dtstr),
+            options.date_formatter(record.fn_attrs[0].atime.dtstr),
+            options.date_formatter(record.fn_attrs[0].ctime.dtstr),
         ]
-    elif 'si' in record:
+    elif hasattr(record, 'si'):
         filename_buffer = [
             'NoFNRecord',
-            options.date_formatter(record['si']['crtime'].dtstr),
-            options.date_formatter(record['si']['mtime'].dtstr),
-            options.date_formatter(record['si']['atime'].dtstr),
-            options.date_formatter(record['si']['ctime'].dtstr),
+            options.date_formatter(record.si.crtime.dtstr),
+            options.date_formatter(record.si.mtime.dtstr),
+            options.date_formatter(record.si.atime.dtstr),
+            options.date_formatter(record.si.ctime.dtstr),
             'NoFNRecord', 'NoFNRecord', 'NoFNRecord', 'NoFNRecord',
         ]
 
@@ -302,12 +445,12 @@ def mft_to_csv(record, ret_header, options):
 
     csv_string.extend(filename_buffer)
 
-    if 'objid' in record:
+    if hasattr(record, 'objid'):
         objid_buffer = [
-            record['objid']['objid'],
-            record['objid']['orig_volid'],
-            record['objid']['orig_objid'],
-            record['objid']['orig_domid'],
+            record.objid['objid'],
+            record.objid['orig_volid'],
+            record.objid['orig_objid'],
+            record.objid['orig_domid'],
         ]
     else:
         objid_buffer = ['', '', '', '']
@@ -315,22 +458,22 @@ def mft_to_csv(record, ret_header, options):
     csv_string.extend(objid_buffer)
 
     # If this goes above four FN attributes, the number of columns will exceed the headers
-    for i in range(1, min(4, record['fncnt'])):
+    for i in range(1, min(4, record.fncnt)):
         filename_buffer = [
-            record['fn', i]['name'],
-            record['fn', i]['crtime'].dtstr,
-            record['fn', i]['mtime'].dtstr,
-            record['fn', i]['atime'].dtstr,
-            record['fn', i]['ctime'].dtstr,
+            record.fn_attrs[i].name,
+            record.fn_attrs[i].crtime.dtstr,
+            record.fn_attrs[i].mtime.dtstr,
+            record.fn_attrs[i].atime.dtstr,
+            record.fn_attrs[i].ctime.dtstr,
         ]
         csv_string.extend(filename_buffer)
 
     # Pad out the remaining FN columns
-    if record['fncnt'] < 2:
+    if record.fncnt < 2:
         tmp_string = ['', '', '', '', '', '', '', '', '', '', '', '', '', '', '']
-    elif record['fncnt'] == 2:
+    elif record.fncnt == 2:
         tmp_string = ['', '', '', '', '', '', '', '', '', '']
-    elif record['fncnt'] == 3:
+    elif record.fncnt == 3:
         tmp_string = ['', '', '', '', '']
     else:
         tmp_string = []
@@ -338,9 +481,9 @@ def mft_to_csv(record, ret_header, options):
     csv_string.extend(tmp_string)
 
     for record_str in ['si', 'al']:
-        csv_string.append('True') if record_str in record else csv_string.append('False')
+        csv_string.append('True') if hasattr(record, record_str) else csv_string.append('False')
 
-    csv_string.append('True') if record['fncnt'] > 0 else csv_string.append('False')
+    csv_string.append('True') if record.fncnt > 0 else csv_string.append('False')
 
     for record_str in [
         'objid',
@@ -356,25 +499,25 @@ def mft_to_csv(record, ret_header, options):
         'propertyset',
         'loggedutility',
     ]:
-        csv_string.append('True') if record_str in record else csv_string.append('False')
+        csv_string.append('True') if hasattr(record, record_str) else csv_string.append('False')
 
-    if 'notes' in record:  # Log of abnormal activity related to this record
-        csv_string.append(record['notes'])
+    if hasattr(record, 'notes'):  # Log of abnormal activity related to this record
+        csv_string.append(record.notes)
     else:
         csv_string.append('None')
-        record['notes'] = ''
+        record.notes = ''
 
-    if 'stf-fn-shift' in record:
+    if hasattr(record, 'stf_fn_shift'):
         csv_string.append('Y')
     else:
         csv_string.append('N')
 
-    if 'usec-zero' in record:
+    if hasattr(record, 'usec_zero'):
         csv_string.append('Y')
     else:
         csv_string.append('N')
 
-    if record['ads'] > 0:
+    if record.ads > 0:
         csv_string.append('Y')
     else:
         csv_string.append('N')
@@ -383,65 +526,148 @@ def mft_to_csv(record, ret_header, options):
 
 
 # MD5|name|inode|mode_as_string|UID|GID|size|atime|mtime|ctime|crtime
+# Attributes that are only noted as present, in the order of their type codes
+JSON_FLAG_ATTRIBUTES = ('sd', 'volname', 'indexroot', 'indexallocation', 'bitmap', 'reparsepoint', 'eainfo', 'ea',
+                        'propertyset', 'loggedutility')
+
+
+def json_times(attr):
+    return {
+        'crtime': attr.crtime.dtstr,
+        'mtime': attr.mtime.dtstr,
+        'atime': attr.atime.dtstr,
+        'ctime': attr.ctime.dtstr,
+    }
+
+
 def mft_to_json(record):
-    json_object = {}
-    
-    if record.has_key('si'):
-        #print "Make Me JSON %s, %s, %s , %s, %s"  % (str(record['recordnum']), str(record['filename']), str(record['magic']), str(record['size']), record['si']['mtime'].dtstr)
-        json_object['filename'] = str(record['filename'])
-        json_object['recordnumber'] = str(record['recordnum'])
-        json_object['recordtype'] = str(record['recordtype'])
-    else:
-        #print str(record['recordnum'])  + str(record['filename'])
-        json_object['filename'] = "nFn"
-        json_object['recordnumber'] = str(record['recordnum'])        
-        
+    """Return a MFT record as a dict ready for json.dumps, one JSON Lines line per record"""
+
+    json_object = {
+        'recordnumber': record.recordnum,
+        'filename': record.filename,
+        'magic': decode_mft_magic(record),
+    }
+
+    if hasattr(record, 'baad') or hasattr(record, 'corrupt'):
+        return json_object
+
+    json_object.update({
+        'active': bool(record.flags & 0x0001),
+        'recordtype': decode_mft_recordtype(record),
+        'flags': record.flags,
+        'sequence': record.seq,
+        'lsn': record.lsn,
+        'linkcount': record.link,
+        'size': record.size,
+        'allocsize': record.alloc_sizef,
+        'base_ref': record.base_ref,
+        'base_seq': record.base_seq,
+    })
+
+    if hasattr(record, 'si'):
+        si = json_times(record.si)
+        si.update({
+            'dos': record.si.dos,
+            'maxver': record.si.maxver,
+            'ver': record.si.ver,
+            'class_id': record.si.class_id,
+            'own_id': record.si.own_id,
+            'sec_id': record.si.sec_id,
+            'quota': record.si.quota,
+            'usn': record.si.usn,
+        })
+        json_object['si'] = si
+
+    fn_list = []
+    for fn in record.fn_attrs if record.fncnt > 0 else ():
+        fn_object = json_times(fn)
+        fn_object.update({
+            'name': fn.name,
+            'namespace': fn.nspace,
+            'par_ref': fn.par_ref,
+            'par_seq': fn.par_seq,
+            'flags': fn.flags,
+            'alloc_fsize': fn.alloc_fsize,
+            'real_fsize': fn.real_fsize,
+        })
+        fn_list.append(fn_object)
+    json_object['fn'] = fn_list
+
+    data_list = []
+    for data in record.data_attrs if record.datacnt > 0 else ():
+        if 'data' in data:
+            data_list.append({'resident': True, 'size': len(data['data'])})
+        else:
+            dataruns = [[length, lcn] for (length, lcn) in iter_runs(data['dataruns'])]
+            data_list.append({'resident': False, 'dataruns': dataruns, 'drunerror': data['drunerror']})
+    json_object['data'] = data_list
+
+    json_object['ads'] = list(record.data_names) if record.ads > 0 else []
+
+    if hasattr(record, 'objid'):
+        json_object['objid'] = record.objid
+
+    if hasattr(record, 'al') and record.al is not None:
+        json_object['attribute_list'] = record.al
+
+    if hasattr(record, 'volinfo'):
+        json_object['volinfo'] = record.volinfo
+
+    json_object['attributes'] = [name for name in JSON_FLAG_ATTRIBUTES if hasattr(record, name)]
+
+    json_object['fixup_failed'] = hasattr(record, 'fixup_failed')
+    json_object['notes'] = record.notes
+    json_object['stf_fn_shift'] = hasattr(record, 'stf_fn_shift')
+    json_object['usec_zero'] = hasattr(record, 'usec_zero')
+
     return json_object
 
+
 def mft_to_body(record, full, std):
     """ Return a MFT record in bodyfile format"""
 
     # Add option to use STD_INFO
 
-    if record['fncnt'] > 0:
+    if record.fncnt > 0:
 
         if full:  # Use full path
-            name = record['filename']
+            name = record.filename
         else:
-            name = record['fn', 0]['name']
+            name = record.fn_attrs[0].name
 
         if std:  # Use STD_INFO
-            rec_bodyfile = ("%s|%s|%s|%s|%s|%s|%s|%d|%d|%d|%d\n" %
-                            ('0', name, '0', '0', '0', '0',
-                             int(record['fn', 0]['real_fsize']),
-                             int(record['si']['atime'].unixtime),  # was str ....
-                             int(record['si']['mtime'].unixtime),
-                             int(record['si']['ctime'].unixtime),
-                             int(record['si']['ctime'].unixtime)))
+            rec_bodyfile = body_line(name, int(record.fn_attrs[0].real_fsize),
+                                     record.si.atime.unixtime,  # was str ....
+                                     record.si.mtime.unixtime,
+                                     record.si.ctime.unixtime,
+                                     record.si.ctime.unixtime)
         else:  # Use FN
-            rec_bodyfile = ("%s|%s|%s|%s|%s|%s|%s|%d|%d|%d|%d\n" %
-                            ('0', name, '0', '0', '0', '0',
-                             int(record['fn', 0]['real_fsize']),
-                             int(record['fn', 0]['atime'].unixtime),
-                             int(record['fn', 0]['mtime'].unixtime),
-                             int(record['fn', 0]['ctime'].unixtime),
-                             int(record['fn', 0]['crtime'].unixtime)))
+            rec_bodyfile = body_line(name, int(record.fn_attrs[0].real_fsize),
+                                     record.fn_attrs[0].atime.unixtime,
+                                     record.fn_attrs[0].mtime.unixtime,
+                                     record.fn_attrs[0].ctime.unixtime,
+                                     record.fn_attrs[0].crtime.unixtime)
 
     else:
-        if 'si' in record:
-            rec_bodyfile = ("%s|%s|%s|%s|%s|%s|%s|%d|%d|%d|%d\n" %
-                            ('0', 'No FN Record', '0', '0', '0', '0', '0',
-                             int(record['si']['atime'].unixtime),  # was str ....
-                             int(record['si']['mtime'].unixtime),
-                             int(record['si']['ctime'].unixtime),
-                             int(record['si']['ctime'].unixtime)))
+        if hasattr(record, 'si'):
+            rec_bodyfile = body_line('No FN Record', '0',
+                                     record.si.atime.unixtime,  # was str ....
+                                     record.si.mtime.unixtime,
+                                     record.si.ctime.unixtime,
+                                     record.si.ctime.unixtime)
         else:
-            rec_bodyfile = ("%s|%s|%s|%s|%s|%s|%s|%d|%d|%d|%d\n" %
-                            ('0', 'Corrupt Record', '0', '0', '0', '0', '0', 0, 0, 0, 0))
+            rec_bodyfile = body_line('Corrupt Record', '0', 0, 0, 0, 0)
 
     return rec_bodyfile
 
 
+def body_line(name, size, atime, mtime, ctime, crtime):
+    """Return a bodyfile line. The times are Unix epoch seconds, and are written as whole seconds."""
+    return "%s|%s|%s|%s|%s|%s|%s|%d|%d|%d|%d\n" % ('0', name, '0', '0', '0', '0', size, int(atime), int(mtime),
+                                                     int(ctime), int(crtime))
+
+
 # l2t CSV output support
 # date,time,timezone,MACB,source,sourcetype,type,user,host,short,desc,version,filename,inode,notes,format,extra
 # http://code.google.com/p/log2timeline/wiki/l2t_csv
@@ -450,9 +676,9 @@ def mft_to_l2t(record):
     """ Return a MFT record in l2t CSV output format"""
 
     csv_string = ''
-    if record['fncnt'] > 0:
+    if record.fncnt > 0:
         for i in ('atime', 'mtime', 'ctime', 'crtime'):
-            (date, time) = record['fn', 0][i].dtstr.split(' ')
+            (date, time) = getattr(record.fn_attrs[0], i).dtstr.split(' ')
 
             macb_str = '....'
             type_str = '....'
@@ -471,13 +697,13 @@ def mft_to_l2t(record):
 
             csv_string = ("%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s\n" % (
                 date, time, 'TZ', macb_str, 'FILE', 'NTFS $MFT', type_str, 'user', 'host',
-                record['filename'],
+                record.filename,
                 'desc',
-                'version', record['filename'], record['seq'], record['notes'], 'format', 'extra'))
+                'version', record.filename, record.seq, record.notes, 'format', 'extra'))
 
-    elif 'si' in record:
+    elif hasattr(record, 'si'):
         for i in ('atime', 'mtime', 'ctime', 'crtime'):
-            (date, time) = record['si'][i].dtstr.split(' ')
+            (date, time) = getattr(record.si, i).dtstr.split(' ')
 
             macb_str = '....'
             type_str = '....'
@@ -496,62 +722,47 @@ def mft_to_l2t(record):
 
             csv_string = ("%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s\n" % (
                 date, time, 'TZ', macb_str, 'FILE', 'NTFS $MFT', type_str, 'user', 'host',
-                record['filename'],
+                record.filename,
                 'desc',
-                'version', record['filename'], record['seq'], record['notes'], 'format', 'extra'))
+                'version', record.filename, record.seq, record.notes, 'format', 'extra'))
 
     else:
         csv_string = ("%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s\n" % (
             '-', '-', 'TZ', 'unknown time', 'FILE', 'NTFS $MFT', 'unknown time', 'user', 'host',
             'Corrupt Record', 'desc',
-            'version', 'NoFNRecord', record['seq'], '-', 'format', 'extra'))
+            'version', 'NoFNRecord', record.seq, '-', 'format', 'extra'))
 
     return csv_string
 
 
 def add_note(record, s):
-    if record['notes'] == '':
-        record['notes'] = "%s" % s
+    if record.notes == '':
+        record.notes = "%s" % s
     else:
-        record['notes'] = "%s | %s |" % (record['notes'], s)
+        record.notes = "%s | %s |" % (record.notes, s)
 
 
 def decode_mft_header(record, raw_record):
-    record['magic'] = struct.unpack("<I", raw_record[:4])[0]
-    record['upd_off'] = struct.unpack("<H", raw_record[4:6])[0]
-    record['upd_cnt'] = struct.unpack("<H", raw_record[6:8])[0]
-    record['lsn'] = struct.unpack("<d", raw_record[8:16])[0]
-    record['seq'] = struct.unpack("<H", raw_record[16:18])[0]
-    record['link'] = struct.unpack("<H", raw_record[18:20])[0]
-    record['attr_off'] = struct.unpack("<H", raw_record[20:22])[0]
-    record['flags'] = struct.unpack("<H", raw_record[22:24])[0]
-    record['size'] = struct.unpack("<I", raw_record[24:28])[0]
-    record['alloc_sizef'] = struct.unpack("<I", raw_record[28:32])[0]
-    record['base_ref'] = struct.unpack("<Lxx", raw_record[32:38])[0]
-    record['base_seq'] = struct.unpack("<H", raw_record[38:40])[0]
-    record['next_attrid'] = struct.unpack("<H", raw_record[40:42])[0]
-    record['f1'] = raw_record[42:44]  # Padding
-    record['recordnum'] = struct.unpack("<I", raw_record[44:48])[0]  # Number of this MFT Record
-    record['seq_number'] = raw_record[48:50]  # Sequence number
-    # Sequence attributes location are hardcoded since the record size is hardcoded too.
-    # The following two lines are subject to NTFS versions. See:
+    (record.magic, record.upd_off, record.upd_cnt, record.lsn, record.seq, record.link,
+     record.attr_off, record.flags, record.size, record.alloc_sizef, record.base_ref,
+     record.base_seq, record.next_attrid,
+     record.f1,  # Padding
+     record.recordnum,  # Number of this MFT Record
+     record.seq_number,  # Update sequence number, when the update sequence array is at offset 48
+     ) = MFT_HEADER.unpack_from(raw_record)
+    # The update sequence array is at offset 42 on NTFS 3.0 and earlier, at 48 after that. apply_fixup sets
+    # seq_number from wherever upd_off says it is. See:
     # https://github.com/libyal/libfsntfs/blob/master/documentation/New%20Technologies%20File%20System%20(NTFS).asciidoc#mft-entry-header
-    if record['upd_off'] == 42:
-        record['seq_attr1'] = raw_record[44:46]  # Sequence attribute for sector 1
-        record['seq_attr2'] = raw_record[46:58]  # Sequence attribute for sector 2
-    else:
-        record['seq_attr1'] = raw_record[50:52]  # Sequence attribute for sector 1
-        record['seq_attr2'] = raw_record[52:54]  # Sequence attribute for sector 2
-    record['fncnt'] = 0  # Counter for number of FN attributes
-    record['datacnt'] = 0  # Counter for number of $DATA attributes
+    record.fncnt = 0  # Counter for number of FN attributes
+    record.datacnt = 0  # Counter for number of $DATA attributes
 
 
 def decode_mft_magic(record):
-    if record['magic'] == 0x454c4946:
+    if record.magic == 0x454c4946:
         return "Good"
-    elif record['magic'] == 0x44414142:
+    elif record.magic == 0x44414142:
         return 'Bad'
-    elif record['magic'] == 0x00000000:
+    elif record.magic == 0x00000000:
         return 'Zero'
     else:
         return 'Unknown'
@@ -564,142 +775,160 @@ def decode_mft_magic(record):
 # I had this coded incorrectly initially. Spencer Lynch identified and fixed the code. Many thanks!
 
 def decode_mft_isactive(record):
-    if record['flags'] & 0x0001:
+    if record.flags & 0x0001:
         return 'Active'
     else:
         return 'Inactive'
 
 
 def decode_mft_recordtype(record):
-    if int(record['flags']) & 0x0002:
+    if int(record.flags) & 0x0002:
         tmp_buffer = 'Folder'
     else:
         tmp_buffer = 'File'
-    if int(record['flags']) & 0x0004:
+    if int(record.flags) & 0x0004:
         tmp_buffer = "%s %s" % (tmp_buffer, '+ Unknown1')
-    if int(record['flags']) & 0x0008:
+    if int(record.flags) & 0x0008:
         tmp_buffer = "%s %s" % (tmp_buffer, '+ Unknown2')
 
     return tmp_buffer
 
 
-def decode_atr_header(s):
-    d = {'type': struct.unpack("<L", s[:4])[0]}
-    if d['type'] == 0xffffffff:
-        return d
-    d['len'] = struct.unpack("<L", s[4:8])[0]
-    d['res'] = struct.unpack("B", s[8])[0]
-    d['nlen'] = struct.unpack("B", s[9])[0]
-    d['name_off'] = struct.unpack("<H", s[10:12])[0]
-    d['flags'] = struct.unpack("<H", s[12:14])[0]
-    d['id'] = struct.unpack("<H", s[14:16])[0]
+def decode_atr_header(s, offset=0, dataruns=True):
+    atr_type = ATR_TYPE.unpack_from(s, offset)[0]
+    if atr_type == 0xffffffff:
+        return {'type': atr_type}
+
+    d = {}
+    (d['type'], d['len'], d['res'], d['nlen'], d['name_off'], d['flags'], d['id']) = ATR_HEADER.unpack_from(s, offset)
     if d['res'] == 0:
-        d['ssize'] = struct.unpack("<L", s[16:20])[0]  # dwLength
-        d['soff'] = struct.unpack("<H", s[20:22])[0]  # wAttrOffset
-        d['idxflag'] = struct.unpack("B", s[22])[0]  # uchIndexedTag
-        _ = struct.unpack("B", s[23])[0]  # Padding
+        (d['ssize'],  # dwLength
+         d['soff'],  # wAttrOffset
+         d['idxflag'],  # uchIndexedTag
+         ) = ATR_RESIDENT.unpack_from(s, offset + 16)
     else:
-        # d['start_vcn'] = struct.unpack("<Lxxxx",s[16:24])[0]    # n64StartVCN
-        # d['last_vcn'] = struct.unpack("<Lxxxx",s[24:32])[0]     # n64EndVCN
-        d['start_vcn'] = struct.unpack("<Q", s[16:24])[0]  # n64StartVCN
-        d['last_vcn'] = struct.unpack("<Q", s[24:32])[0]  # n64EndVCN
-        d['run_off'] = struct.unpack("<H", s[32:34])[0]  # wDataRunOffset (in clusters, from start of partition?)
-        d['compsize'] = struct.unpack("<H", s[34:36])[0]  # wCompressionSize
-        _ = struct.unpack("<I", s[36:40])[0]  # Padding
-        d['allocsize'] = struct.unpack("<Lxxxx", s[40:48])[0]  # n64AllocSize
-        d['realsize'] = struct.unpack("<Lxxxx", s[48:56])[0]  # n64RealSize
-        d['streamsize'] = struct.unpack("<Lxxxx", s[56:64])[0]  # n64StreamSize
-        (d['ndataruns'], d['dataruns'], d['drunerror']) = unpack_dataruns(s[64:])
+        (d['start_vcn'],  # n64StartVCN
+         d['last_vcn'],  # n64EndVCN
+         d['run_off'],  # wDataRunOffset (in clusters, from start of partition?)
+         d['compsize'],  # wCompressionSize
+         d['allocsize'],  # n64AllocSize
+         d['realsize'],  # n64RealSize
+         d['streamsize'],  # n64StreamSize
+         ) = ATR_NONRESIDENT.unpack_from(s, offset + 16)
+        # The runlist runs from its offset to the end of the attribute. Only $DATA dataruns are kept.
+        if not dataruns or d['type'] != 0x80:
+            return d
+        (d['ndataruns'], d['dataruns'], d['drunerror']) = unpack_dataruns(
+            s[offset + d['run_off']:offset + d['len']])
 
     return d
 
 
 # Dataruns - http://inform.pucp.edu.pe/~inf232/Ntfs/ntfs_doc_v0.5/concepts/data_runs.html
-def unpack_dataruns(datarun_str):
-    dataruns = []
-    numruns = 0
+#
+# Each run starts with a header byte: the low nibble is the size of the run length and the high nibble the size
+# of the run offset, both little endian. The length is unsigned. The offset is signed and relative to the LCN of
+# the previous run. A run without an offset is sparse. A zero header byte ends the list.
+def unpack_dataruns(datarun_str, pos=0):
+    """Decode a runlist into compact arrays of run lengths and starting LCNs
+
+    Returns (number of runs, (lengths, lcns), error). Sparse runs have a LCN of SPARSE_LCN, see iter_runs. error
+    is '' unless the runlist
+    is malformed, in which case the runs decoded up to that point are returned."""
+
+    datarun_str = str(datarun_str[pos:])
+    end = len(datarun_str)
     pos = 0
-    prevoffset = 0
-    error = ''
-
-    c_uint8 = ctypes.c_uint8
-
-    class LengthBits(ctypes.LittleEndianStructure):
-        _fields_ = [
-            ("lenlen", c_uint8, 4),
-            ("offlen", c_uint8, 4),
-        ]
 
-    class Lengths(ctypes.Union):
-        _fields_ = [("b", LengthBits),
-                    ("asbyte", c_uint8)]
-
-    lengths = Lengths()
-
-    # mftutils.hexdump(str,':',16)
+    lengths = array(DATARUN_TYPECODE)
+    lcns = array(DATARUN_TYPECODE)
+    lcn = 0
+    error = ''
 
-    while True:
-        lengths.asbyte = struct.unpack("B", datarun_str[pos])[0]
+    while pos < end:
+        header = ord(datarun_str[pos])
         pos += 1
-        if lengths.asbyte == 0x00:
+        if header == 0x00:
             break
 
-        if lengths.b.lenlen > 6 or lengths.b.lenlen == 0:
+        lenlen = header & 0x0f
+        offlen = header >> 4
+        if lenlen == 0 or lenlen > 8 or offlen > 8 or pos + lenlen + offlen > end:
             error = "Datarun oddity."
             break
 
-        bit_len = bitparse.parse_little_endian_signed(datarun_str[pos:pos + lengths.b.lenlen])
-
-        # print lengths.b.lenlen, lengths.b.offlen, bit_len
-        pos += lengths.b.lenlen
+        length = UINT64.unpack(datarun_str[pos:pos + lenlen] + ZERO_PAD[lenlen:])[0]
+        pos += lenlen
 
-        if lengths.b.offlen > 0:
-            offset = bitparse.parse_little_endian_signed(datarun_str[pos:pos + lengths.b.offlen])
-            offset = offset + prevoffset
-            prevoffset = offset
-            pos += lengths.b.offlen
+        if offlen > 0:
+            offset = datarun_str[pos:pos + offlen]
+            if ord(offset[-1]) & 0x80:
+                lcn += INT64.unpack(offset + SIGN_PAD[offlen:])[0]
+            else:
+                lcn += INT64.unpack(offset + ZERO_PAD[offlen:])[0]
+            pos += offlen
+            run_lcn = lcn
         else:  # Sparse
-            offset = 0
-            pos += 1
+            run_lcn = SPARSE_LCN
 
-        dataruns.append([bit_len, offset])
-        numruns += 1
+        try:
+            lengths.append(length)
+            lcns.append(run_lcn)
+        except OverflowError:  # Too large for the array, so not a real run
+            del lengths[len(lcns):]
+            error = "Datarun oddity."
+            break
 
-        # print "Lenlen: %d Offlen: %d Len: %d Offset: %d" % (lengths.b.lenlen, lengths.b.offlen, bit_len, offset)
+    return len(lengths), (lengths, lcns), error
 
-    return numruns, dataruns, error
 
+def iter_runs(dataruns):
+    """Yield (length, LCN) for each run of (lengths, lcns) from unpack_dataruns, with None for the LCN of a sparse
+    run"""
 
-def decode_si_attribute(s, localtz):
-    d = {
-        'crtime': mftutils.WindowsTime(struct.unpack("<L", s[:4])[0], struct.unpack("<L", s[4:8])[0], localtz),
-        'mtime': mftutils.WindowsTime(struct.unpack("<L", s[8:12])[0], struct.unpack("<L", s[12:16])[0], localtz),
-        'ctime': mftutils.WindowsTime(struct.unpack("<L", s[16:20])[0], struct.unpack("<L", s[20:24])[0], localtz),
-        'atime': mftutils.WindowsTime(struct.unpack("<L", s[24:28])[0], struct.unpack("<L", s[28:32])[0], localtz),
-        'dos': struct.unpack("<I", s[32:36])[0], 'maxver': struct.unpack("<I", s[36:40])[0],
-        'ver': struct.unpack("<I", s[40:44])[0], 'class_id': struct.unpack("<I", s[44:48])[0],
-        'own_id': struct.unpack("<I", s[48:52])[0], 'sec_id': struct.unpack("<I", s[52:56])[0],
-        'quota': struct.unpack("<d", s[56:64])[0], 'usn': struct.unpack("<d", s[64:72])[0],
-    }
+    for (length, lcn) in zip(*dataruns):
+        yield int(length), None if lcn == SPARSE_LCN else int(lcn)
+
+
+def decode_si_attribute(s, localtz, offset=0):
+    d = mftrecord.StdInfoAttr()
+    (crtime_low, crtime_high, mtime_low, mtime_high, ctime_low, ctime_high, atime_low, atime_high, d.dos,
+     d.maxver, d.ver, d.class_id, d.own_id, d.sec_id, d.quota, d.usn) = SI_ATTRIBUTE.unpack_from(s, offset)
+    d.crtime = mftutils.WindowsTime(crtime_low, crtime_high, localtz)
+    d.mtime = mftutils.WindowsTime(mtime_low, mtime_high, localtz)
+    d.ctime = mftutils.WindowsTime(ctime_low, ctime_high, localtz)
+    d.atime = mftutils.WindowsTime(atime_low, atime_high, localtz)
 
     return d
 
 
-def decode_fn_attribute(s, localtz, _):
+def decode_fn_attribute(s, localtz, _, offset=0):
     # File name attributes can have null dates.
 
-    d = {
-        'par_ref': struct.unpack("<Lxx", s[:6])[0], 'par_seq': struct.unpack("<H", s[6:8])[0],
-        'crtime': mftutils.WindowsTime(struct.unpack("<L", s[8:12])[0], struct.unpack("<L", s[12:16])[0], localtz),
-        'mtime': mftutils.WindowsTime(struct.unpack("<L", s[16:20])[0], struct.unpack("<L", s[20:24])[0], localtz),
-        'ctime': mftutils.WindowsTime(struct.unpack("<L", s[24:28])[0], struct.unpack("<L", s[28:32])[0], localtz),
-        'atime': mftutils.WindowsTime(struct.unpack("<L", s[32:36])[0], struct.unpack("<L", s[36:40])[0], localtz),
-        'alloc_fsize': struct.unpack("<q", s[40:48])[0], 'real_fsize': struct.unpack("<q", s[48:56])[0],
-        'flags': struct.unpack("<d", s[56:64])[0], 'nlen': struct.unpack("B", s[64])[0],
-        'nspace': struct.unpack("B", s[65])[0],
-    }
+    d = mftrecord.FileNameAttr()
+    (d.par_ref, d.par_seq, crtime_low, crtime_high, mtime_low, mtime_high, ctime_low, ctime_high, atime_low,
+     atime_high, d.alloc_fsize, d.real_fsize, d.flags, d.nlen, d.nspace) = FN_ATTRIBUTE.unpack_from(s, offset)
+    d.crtime = mftutils.WindowsTime(crtime_low, crtime_high, localtz)
+    d.mtime = mftutils.WindowsTime(mtime_low, mtime_high, localtz)
+    d.ctime = mftutils.WindowsTime(ctime_low, ctime_high, localtz)
+    d.atime = mftutils.WindowsTime(atime_low, atime_high, localtz)
 
-    attr_bytes = s[66:66 + d['nlen'] * 2]
+    attr_bytes = s[offset + 66:offset + 66 + d.nlen * 2]
+    try:
+        d.name = attr_bytes.decode('utf-16').encode('utf-8')
+    except:
+        d.name = 'UnableToDecodeFilename'
+
+    return d
+
+
+def decode_fn_name(s, offset=0):
+    # Just the parts of a file name attribute needed to build paths
+
+    d = {}
+    (d['par_ref'], d['nlen'], d['nspace']) = FN_NAME.unpack_from(s, offset)
+
+    attr_bytes = s[offset + 66:offset + 66 + d['nlen'] * 2]
     try:
         d['name'] = attr_bytes.decode('utf-16').encode('utf-8')
     except:
@@ -708,26 +937,20 @@ def decode_fn_attribute(s, localtz, _):
     return d
 
 
-def decode_attribute_list(s, _):
-    d = {
-        'type': struct.unpack("<I", s[:4])[0], 'len': struct.unpack("<H", s[4:6])[0],
-        'nlen': struct.unpack("B", s[6])[0], 'f1': struct.unpack("B", s[7])[0],
-        'start_vcn': struct.unpack("<d", s[8:16])[0], 'file_ref': struct.unpack("<Lxx", s[16:22])[0],
-        'seq': struct.unpack("<H", s[22:24])[0], 'id': struct.unpack("<H", s[24:26])[0],
-    }
+def decode_attribute_list(s, _, offset=0):
+    d = {}
+    (d['type'], d['len'], d['nlen'], d['f1'], d['start_vcn'], d['file_ref'], d['seq'],
+     d['id']) = ATTRIBUTE_LIST.unpack_from(s, offset)
 
-    attr_bytes = s[26:26 + d['nlen'] * 2]
+    attr_bytes = s[offset + 26:offset + 26 + d['nlen'] * 2]
     d['name'] = attr_bytes.decode('utf-16').encode('utf-8')
 
     return d
 
 
-def decode_volume_info(s, options):
-    d = {
-        'f1': struct.unpack("<d", s[:8])[0], 'maj_ver': struct.unpack("B", s[8])[0],
-        'min_ver': struct.unpack("B", s[9])[0], 'flags': struct.unpack("<H", s[10:12])[0],
-        'f2': struct.unpack("<I", s[12:16])[0],
-    }
+def decode_volume_info(s, options, offset=0):
+    d = {}
+    (d['f1'], d['maj_ver'], d['min_ver'], d['flags'], d['f2']) = VOLUME_INFO.unpack_from(s, offset)
 
     if options.debug:
         print "+Volume Info"
@@ -741,19 +964,19 @@ def decode_volume_info(s, options):
 
 
 # Decode a Resident Data Attribute
-def decode_data_attribute(s, at_rrecord):
-    d = {'data': s[:at_rrecord['ssize']]}
+def decode_data_attribute(s, at_rrecord, offset=0):
+    d = {'data': bytes(s[offset:offset + at_rrecord['ssize']])}
 
     #        print 'Data: ', d['data']
     return d
 
 
-def decode_object_id(s):
+def decode_object_id(s, offset=0):
     d = {
-        'objid': object_id(s[0:16]),
-        'orig_volid': object_id(s[16:32]),
-        'orig_objid': object_id(s[32:48]),
-        'orig_domid': object_id(s[48:64]),
+        'objid': object_id(bytes(s[offset:offset + 16])),
+        'orig_volid': object_id(bytes(s[offset + 16:offset + 32])),
+        'orig_objid': object_id(bytes(s[offset + 32:offset + 48])),
+        'orig_domid': object_id(bytes(s[offset + 48:offset + 64])),
     }
 
     return d
@@ -771,18 +994,18 @@ def object_id(s):
 
 def anomaly_detect(record):
     # Check for STD create times that are before the FN create times
-    if record['fncnt'] > 0:
-        #          print record['si']['crtime'].dt, record['fn', 0]['crtime'].dt
+    if record.fncnt > 0:
+        #          print record.si.crtime.dt, record.fn_attrs[0].crtime.dt
 
         try:
-            if (record['fn', 0]['crtime'].dt == 0) or (record['si']['crtime'].dt < record['fn', 0]['crtime'].dt):
-                record['stf-fn-shift'] = True
+            if (record.fn_attrs[0].crtime.dt == 0) or (record.si.crtime.dt < record.fn_attrs[0].crtime.dt):
+                record.stf_fn_shift = True
         # This is a kludge - there seem to be some legit files that trigger an exception in the above. Needs to be
         # investigated
         except:
-            record['stf-fn-shift'] = True
+            record.stf_fn_shift = True
 
         # Check for STD create times with a nanosecond value of '0'
-        if record['fn', 0]['crtime'].dt != 0:
-            if record['fn', 0]['crtime'].dt.microsecond == 0:
-                record['usec-zero'] = True
+        if record.fn_attrs[0].crtime.dt != 0:
+            if record.fn_attrs[0].crtime.dt.microsecond == 0:
+                record.usec_zero = True
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# Name: mftbatch.py
+#
+# Optional NumPy accelerated decoding of whole batches of fixed size MFT records into columns. Only the fields a
+# timeline needs are decoded: record number, flags, sequence number, the parent reference and size from the first
+# $FILE_NAME attribute, and the four $STANDARD_INFORMATION and $FILE_NAME times as Unix epoch seconds. Everything
+# runs as array operations over the batch, so there is no per-record Python overhead. MftSession writes the
+# bodyfile from these columns when it is the only output, see MftSession.batch_body.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import mftutils
+
+# Give up walking the attributes of a record after this many
+MAX_ATTRIBUTES = 64
+
+COLUMNS = (('recordnum', 'u4'), ('valid', 'bool'), ('simple', 'bool'), ('flags', 'u2'), ('seq', 'u2'),
+           ('par_ref', 'i8'), ('real_fsize', 'i8')) + \
+    tuple(('si_' + name, 'f8') for name in mftutils.TIME_FIELDS) + \
+    tuple(('fn_' + name, 'f8') for name in mftutils.TIME_FIELDS)
+
+
+def available():
+    return numpy is not None
+
+
+def filetime_to_unix(filetimes, localtz=False):
+    """Convert an array of FILETIMEs to Unix epoch seconds, the way WindowsTime.unixtime does
+
+    Zero FILETIMEs become 0. Times outside [0, UNIX_TIME_SAFE_MAX), which are rare, are converted one at a time
+    by WindowsTime, so they are 0 exactly where it finds them invalid."""
+
+    unixtimes = filetimes.astype('f8') * 1e-7 - mftutils.EPOCH_SECONDS
+    unixtimes[filetimes == 0] = 0
+
+    for i in numpy.flatnonzero((filetimes != 0) & ((unixtimes < 0) | (unixtimes >= mftutils.UNIX_TIME_SAFE_MAX))):
+        unixtimes[i] = mftutils.WindowsTime.from_filetime(long(filetimes[i]), localtz).unixtime
+
+    return unixtimes
+
+
+def _field(records, offset, dtype):
+    # The field at a fixed offset in every record
+    return records[:, offset:offset + numpy.dtype(dtype).itemsize].copy().view(dtype)[:, 0]
+
+
+def _gather(records, rows, offsets, dtype):
+    # The field at a per record offset
+    size = numpy.dtype(dtype).itemsize
+    columns = offsets[:, None] + numpy.arange(size)
+    return numpy.ascontiguousarray(records[rows[:, None], columns]).view(dtype)[:, 0]
+
+
+def apply_fixup(records):
+    """Apply the update sequence fixup to every record of a writable (n, record_size) uint8 array
+
+    As in mft.apply_fixup, the stride is worked out from the record size and the number of entries in each
+    record's update sequence array, so any record and sector size works. Strides that do not end in the update
+    sequence number are left as they are. Returns a boolean array that is False for those records, and for records
+    whose update sequence array does not fit."""
+
+    (num_records, record_size) = records.shape
+    rows = numpy.arange(num_records)
+    upd_off = _field(records, 4, '<u2').astype('i8')
+    strides = _field(records, 6, '<u2').astype('i8') - 1
+
+    usa_ok = ((strides >= 1) & (record_size % numpy.maximum(strides, 1) == 0) &
+              (upd_off + 2 * (strides + 1) <= record_size))
+    ok = usa_ok.copy()
+
+    # Records with the same number of strides are fixed up together. There is usually only the one.
+    for count in numpy.unique(strides[usa_ok]):
+        group = rows[usa_ok & (strides == count)]
+        stride = record_size // int(count)
+        usn = _gather(records, group, upd_off[group], '<u2')
+
+        for (i, end) in enumerate(range(stride, record_size + 1, stride)):
+            match = _gather(records, group, numpy.full(len(group), end - 2, 'i8'), '<u2') == usn
+            ok[group[~match]] = False
+            fix = group[match]
+            for byte in (0, 1):
+                records[fix, end - 2 + byte] = records[fix, upd_off[fix] + 2 * (i + 1) + byte]
+
+    return ok
+
+
+def decode_batch(buf, record_size=1024, localtz=False, names=False):
+    """Decode the records in buf, a buffer holding whole records, into a dict of column arrays
+
+    The column names and types are in COLUMNS. Records that are not good FILE records have valid set to False
+    and nothing else decoded. As in parse_record, the fixup is applied where it matches and records where it
+    does not are decoded as they are. par_ref is -1 for records without a $FILE_NAME attribute, and times are 0
+    when the attribute is missing. With names, the columns also hold fn_name, a list of the name in the first
+    $FILE_NAME attribute of each record as parse_record decodes it, or '' without one.
+
+    simple is True for the records these columns describe completely, just as parse_record would: good FILE
+    records whose fixup matched, with one $STANDARD_INFORMATION and only resident $FILE_NAME attributes, at least
+    one, no named $DATA streams, and an attribute chain that ends inside the record."""
+
+    if numpy is None:
+        raise ImportError('NumPy is needed for batch decoding')
+
+    num_records = len(buf) // record_size
+    # A private copy of the batch, so the fixup can be applied in place
+    records = numpy.frombuffer(buf, dtype='u1', count=num_records * record_size).reshape(num_records,
+                                                                                          record_size).copy()
+    rows = numpy.arange(num_records)
+
+    columns = dict((name, numpy.zeros(num_records, dtype)) for (name, dtype) in COLUMNS)
+    columns['recordnum'] = _field(records, 44, '<u4')
+    columns['flags'] = _field(records, 22, '<u2')
+    columns['seq'] = _field(records, 16, '<u2')
+    columns['par_ref'][:] = -1
+
+    valid = _field(records, 0, '<u4') == 0x454c4946
+    columns['valid'] = valid
+    fixed = apply_fixup(records)
+
+    # Walk the attribute chains of all records in lock step, noting the first $STANDARD_INFORMATION and
+    # $FILE_NAME content offsets
+    pos = numpy.where(valid, _field(records, 20, '<u2'), 0).astype('i8')
+    active = valid.copy()
+    si_off = numpy.full(num_records, -1, 'i8')
+    fn_off = numpy.full(num_records, -1, 'i8')
+    si_count = numpy.zeros(num_records, 'i8')
+    ended = numpy.zeros(num_records, 'bool')
+    unusual = numpy.zeros(num_records, 'bool')
+
+    for _ in range(MAX_ATTRIBUTES):
+        active &= pos + 24 <= record_size
+        if not active.any():
+            break
+
+        live = rows[active]
+        atr_type = _gather(records, live, pos[live], '<u4')
+        atr_len = _gather(records, live, pos[live] + 4, '<u4').astype('i8')
+        soff = _gather(records, live, pos[live] + 20, '<u2').astype('i8')
+        resident = records[live, pos[live] + 8] == 0
+        named = records[live, pos[live] + 9] > 0
+
+        is_si = (atr_type == 0x10) & resident & (si_off[live] < 0)
+        si_off[live[is_si]] = pos[live[is_si]] + soff[is_si]
+        is_fn = (atr_type == 0x30) & resident & (fn_off[live] < 0)
+        fn_off[live[is_fn]] = pos[live[is_fn]] + soff[is_fn]
+
+        si_count[live[atr_type == 0x10]] += 1
+        unusual[live[((atr_type == 0x10) | (atr_type == 0x30)) & ~resident]] = True
+        unusual[live[(atr_type == 0x80) & named]] = True
+
+        ended[live[atr_type == 0xffffffff]] = True
+        done = (atr_type == 0xffffffff) | (atr_len <= 0)
+        active[live[done]] = False
+        pos[live] += numpy.where(done, 0, atr_len)
+
+    si_ok = (si_off >= 0) & (si_off + 32 <= record_size)
+    has_si = rows[si_ok]
+    for (i, name) in enumerate(mftutils.TIME_FIELDS):
+        columns['si_' + name][has_si] = filetime_to_unix(_gather(records, has_si, si_off[has_si] + 8 * i, '<u8'),
+                                                         localtz)
+
+    fn_ok = (fn_off >= 0) & (fn_off + 66 <= record_size)
+    has_fn = rows[fn_ok]
+    columns['par_ref'][has_fn] = _gather(records, has_fn, fn_off[has_fn], '<u4')
+    columns['real_fsize'][has_fn] = _gather(records, has_fn, fn_off[has_fn] + 48, '<i8')
+    for (i, name) in enumerate(mftutils.TIME_FIELDS):
+        columns['fn_' + name][has_fn] = filetime_to_unix(_gather(records, has_fn, fn_off[has_fn] + 8 + 8 * i,
+                                                                 '<u8'), localtz)
+
+    columns['simple'] = valid & fixed & ended & ~unusual & (si_count == 1) & si_ok & fn_ok
+
+    if names:
+        columns['fn_name'] = [''] * num_records
+        for row in has_fn:
+            offset = fn_off[row]
+            nlen = records[row, offset + 64]
+            try:
+                name = records[row, offset + 66:offset + 66 + 2 * nlen].tostring().decode('utf-16').encode('utf-8')
+            except:
+                name = 'UnableToDecodeFilename'
+            columns['fn_name'][row] = name
+
+    return columns
+
+
+def iter_batches(reader, batch_records=65536, localtz=False, names=False):
+    """Yield (first record number, columns) for consecutive batches of the records of a mftreader reader"""
+
+    for start in range(0, len(reader), batch_records):
+        stop = min(start + batch_records, len(reader))
+        yield start, decode_batch(reader.view(start, stop), reader.record_size, localtz, names)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+# Name: mftcache.py
+#
+# On-disk cache of a decoded MFT. The decoded records, with their full paths, and the path table are kept in a
+# SQLite database so that later runs over the same MFT, with different output options, skip decoding entirely.
+# RecordStore uses the same record encoding to spill the records kept with -s to disk past a memory limit.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import atexit
+import hashlib
+import json
+import marshal
+import os
+import sqlite3
+import sys
+import tempfile
+from UserDict import DictMixin
+from array import array
+
+import mft
+import mftpaths
+import mftrecord
+import mftutils
+
+# Bump when the layout of the cached records changes, so old caches are rebuilt rather than misread
+CACHE_VERSION = 2
+
+# Records written to the database per executemany call
+INSERT_BATCH_RECORDS = 1000
+
+# RecordStore measures the footprint of one record in this many and takes the average as the size of the rest
+FOOTPRINT_SAMPLE_RECORDS = 64
+
+# Stands in for a slot that was never assigned. marshal can store it, and no decoded value is ever Ellipsis.
+UNSET = Ellipsis
+
+
+def cache_key(reader, options):
+    """Return what a cache must have been built from to be used for the MFT read by reader and these options
+
+    The MFT is identified by the SHA-1 of its records, which for a volume image are only the clusters of its $MFT,
+    as well as its size and the modification time of options.filename, which for a compressed MFT is the
+    compressed file rather than the one it was decompressed to. The options that change the decoded records or
+    their paths are part of the key too."""
+
+    digest = hashlib.sha1()
+    block_records = max(1, 4 * 1024 * 1024 // reader.record_size)
+    for start in xrange(0, len(reader), block_records):
+        digest.update(reader.view(start, start + block_records))
+
+    return {
+        'version': CACHE_VERSION,
+        'sha1': digest.hexdigest(),
+        'size': len(reader) * reader.record_size,
+        'mtime': os.stat(options.filename).st_mtime,
+        'record_size': reader.record_size,
+        'localtz': bool(options.localtz),
+        'anomaly': bool(options.anomaly),
+        'winpath': bool(options.winpath),
+    }
+
+
+def _pack_attr(attr):
+    return tuple(getattr(attr, slot).filetime if slot in mftutils.TIME_FIELDS else getattr(attr, slot, UNSET)
+                 for slot in attr.__slots__)
+
+
+def _unpack_attr(cls, values, localtz):
+    attr = cls.__new__(cls)
+    for (slot, value) in zip(cls.__slots__, values):
+        if value is UNSET:
+            continue
+        if slot in mftutils.TIME_FIELDS:
+            value = mftutils.WindowsTime.from_filetime(value, localtz)
+        setattr(attr, slot, value)
+    return attr
+
+
+def pack_record(record):
+    """Return a decoded record as a compact string"""
+
+    values = []
+    for slot in mftrecord.MftRecord.__slots__:
+        value = getattr(record, slot, UNSET)
+        if value is UNSET:
+            pass
+        elif slot == 'si':
+            value = _pack_attr(value)
+        elif slot == 'fn_attrs':
+            value = [_pack_attr(fn) for fn in value]
+        elif slot == 'data_attrs':
+            value = [dict(data, dataruns=(data['dataruns'][0].tolist(), data['dataruns'][1].tolist()))
+                     if 'dataruns' in data else data for data in value]
+        values.append(value)
+
+    return marshal.dumps(tuple(values), 2)
+
+
+def unpack_record(packed, localtz):
+    """Return the record packed by pack_record"""
+
+    record = mftrecord.MftRecord.__new__(mftrecord.MftRecord)
+    for (slot, value) in zip(mftrecord.MftRecord.__slots__, marshal.loads(packed)):
+        if value is UNSET:
+            continue
+        if slot == 'si':
+            value = _unpack_attr(mftrecord.StdInfoAttr, value, localtz)
+        elif slot == 'fn_attrs':
+            value = [_unpack_attr(mftrecord.FileNameAttr, fn, localtz) for fn in value]
+        elif slot == 'data_attrs':
+            for data in value:
+                if 'dataruns' in data:
+                    (lengths, lcns) = data['dataruns']
+                    data['dataruns'] = (array(mft.DATARUN_TYPECODE, lengths), array(mft.DATARUN_TYPECODE, lcns))
+        setattr(record, slot, value)
+
+    return record
+
+
+class RecordCache:
+    """A SQLite database holding the decoded records of one MFT and its path table
+
+    A cache is only used when its key, from cache_key, matches. Building one starts with start(), adds every
+    record with add() and ends with finish(), which stores the key last: a cache that was never finished has
+    no key and is rebuilt on the next run."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        # connect does not read the file, so a file that is not a SQLite database is only found out here, with a
+        # sqlite3.DatabaseError
+        self.db.execute("PRAGMA schema_version")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.pending = []
+
+    def matches(self, key):
+        """Return True if the cache was built for key"""
+
+        try:
+            row = self.db.execute("SELECT value FROM meta WHERE name = 'key'").fetchone()
+        except sqlite3.DatabaseError:
+            return False
+
+        return row is not None and json.loads(row[0]) == key
+
+    def start(self):
+        """Empty the cache, ready for the records of a new MFT"""
+
+        self.db.executescript("""
+            DROP TABLE IF EXISTS meta;
+            DROP TABLE IF EXISTS records;
+            CREATE TABLE meta (name TEXT PRIMARY KEY, value);
+            CREATE TABLE records (num INTEGER PRIMARY KEY, record BLOB);
+        """)
+        self.pending = []
+
+    def add(self, num, record):
+        """Add the record at position num in the MFT"""
+
+        self.pending.append((num, buffer(pack_record(record))))
+        if len(self.pending) >= INSERT_BATCH_RECORDS:
+            self._insert()
+
+    def _insert(self):
+        self.db.executemany("INSERT INTO records VALUES (?, ?)", self.pending)
+        self.pending = []
+
+    def finish(self, key, paths):
+        """Store the path table and the key, and commit"""
+
+        self._insert()
+        self.db.execute("INSERT INTO meta VALUES ('paths', ?)",
+                        (buffer(marshal.dumps((paths.names, paths.parents.tolist()), 2)),))
+        self.db.execute("INSERT INTO meta VALUES ('key', ?)", (json.dumps(key),))
+        self.db.commit()
+
+    def load_paths(self, path_sep):
+        """Return the cached path table"""
+
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'paths'").fetchone()
+        (names, parents) = marshal.loads(str(row[0]))
+
+        paths = mftpaths.PathTable(path_sep)
+        paths.names = names
+        paths.parents = array(paths.parents.typecode, parents)
+
+        return paths
+
+    def records(self, localtz):
+        """Yield (position in the MFT, record) for the cached records, in MFT order"""
+
+        for (num, packed) in self.db.execute("SELECT num, record FROM records ORDER BY num"):
+            yield num, unpack_record(str(packed), localtz)
+
+    def close(self):
+        self.db.close()
+
+
+class RecordStore(DictMixin):
+    """A dict of decoded records by position in the MFT, as kept with -s, that holds at most limit bytes in memory
+
+    Records are kept in memory until their footprint, plus what reserved returns, reaches limit. reserved is a
+    function giving the bytes used by the path table, which are counted against limit as well. Every later record is packed with pack_record into a temporary SQLite database, deleted on
+    close or at exit, and read back when it is looked up. The footprint is measured on one record in
+    FOOTPRINT_SAMPLE_RECORDS. With no limit every record stays in memory."""
+
+    def __init__(self, limit=None, localtz=False):
+        self.limit = limit
+        self.localtz = localtz
+        self.reserved = lambda: 0
+        self.memory = {}
+        self.added = 0
+        self.sampled = 0
+        self.sampled_bytes = 0
+        self.filename = None
+        self.db = None
+        self.pending = []
+
+    def footprint(self):
+        """Return the estimated number of bytes used by the records in memory"""
+
+        if not self.sampled:
+            return 0
+        return sys.getsizeof(self.memory) + self.sampled_bytes * len(self.memory) // self.sampled
+
+    def spilled(self):
+        """Return True once records are being written to disk"""
+        return self.db is not None
+
+    def __setitem__(self, num, record):
+        if self.db is None or num in self.memory:
+            self.memory[num] = record
+            if self.limit is None or self.db is not None:
+                return
+
+            if self.added % FOOTPRINT_SAMPLE_RECORDS == 0:
+                self.sampled += 1
+                self.sampled_bytes += mftutils.footprint(record)
+            self.added += 1
+
+            if self.reserved() + self.footprint() >= self.limit:
+                self._open()
+            return
+
+        self.pending.append((num, buffer(pack_record(record))))
+        if len(self.pending) >= INSERT_BATCH_RECORDS:
+            self._insert()
+
+    def _open(self):
+        (fd, self.filename) = tempfile.mkstemp(prefix='analyzemft-', suffix='.db')
+        os.close(fd)
+        self.db = sqlite3.connect(self.filename)
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("PRAGMA journal_mode=OFF")
+        self.db.execute("CREATE TABLE records (num INTEGER PRIMARY KEY, record BLOB)")
+        atexit.register(self.close)
+
+    def _insert(self):
+        if self.pending:
+            self.db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?)", self.pending)
+            self.pending = []
+
+    def __getitem__(self, num):
+        if num in self.memory:
+            return self.memory[num]
+        if self.db is not None:
+            self._insert()
+            row = self.db.execute("SELECT record FROM records WHERE num = ?", (num,)).fetchone()
+            if row is not None:
+                return unpack_record(str(row[0]), self.localtz)
+        raise KeyError(num)
+
+    def __delitem__(self, num):
+        if num in self.memory:
+            del self.memory[num]
+        elif num in self:
+            self.db.execute("DELETE FROM records WHERE num = ?", (num,))
+        else:
+            raise KeyError(num)
+
+    def __contains__(self, num):
+        if num in self.memory:
+            return True
+        if self.db is None:
+            return False
+        self._insert()
+        return self.db.execute("SELECT 1 FROM records WHERE num = ?", (num,)).fetchone() is not None
+
+    def has_key(self, num):
+        return num in self
+
+    def __len__(self):
+        if self.db is None:
+            return len(self.memory)
+        self._insert()
+        return len(self.memory) + self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def keys(self):
+        return list(self)
+
+    def __iter__(self):
+        for num in self.memory.keys():
+            yield num
+        if self.db is not None:
+            self._insert()
+            for (num,) in self.db.execute("SELECT num FROM records ORDER BY num"):
+                yield num
+
+    def iteritems(self):
+        for item in self.memory.items():
+            yield item
+        if self.db is not None:
+            self._insert()
+            for (num, packed) in self.db.execute("SELECT num, record FROM records ORDER BY num"):
+                yield num, unpack_record(str(packed), self.localtz)
+
+    def itervalues(self):
+        for (_, record) in self.iteritems():
+            yield record
+
+    def close(self):
+        """Drop the records and delete the temporary database"""
+
+        self.memory = {}
+        self.pending = []
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            os.remove(self.filename)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Name: mftcolumns.py
+#
+# Typed, columnar output of decoded MFT records. The columns are written to a Parquet file when pyarrow is
+# installed, and to a NumPy .npz file when only NumPy is. Rows are gathered from the parse loop and written out a
+# row group at a time.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import mftutils
+
+# Rows per Parquet row group, and per batch converted to NumPy arrays
+ROW_GROUP_RECORDS = 65536
+
+# Attributes reported as present or not, in the order of the CSV output
+ATTRIBUTE_FIELDS = ('si', 'al', 'fn', 'objid', 'volname', 'volinfo', 'data', 'indexroot', 'indexallocation',
+                    'bitmap', 'reparsepoint', 'eainfo', 'ea', 'propertyset', 'loggedutility')
+
+# Column name and type. Times are microseconds since the Unix epoch, UTC, and 0 when not defined. Numbers that
+# are missing, such as the parent of a record without a $FILE_NAME attribute, are -1.
+SCHEMA = ((('recordnum', 'int64'), ('good', 'bool'), ('baad', 'bool'), ('active', 'bool'), ('folder', 'bool'),
+           ('seq', 'int64'), ('par_ref', 'int64'), ('par_seq', 'int64'), ('filename', 'string'),
+           ('name', 'string')) +
+          tuple(('si_' + name, 'timestamp') for name in mftutils.TIME_FIELDS) +
+          tuple(('fn_' + name, 'timestamp') for name in mftutils.TIME_FIELDS) +
+          (('alloc_fsize', 'int64'), ('real_fsize', 'int64'), ('fncnt', 'int64'), ('ads', 'int64')) +
+          tuple(('has_' + name, 'bool') for name in ATTRIBUTE_FIELDS) +
+          (('fixup_failed', 'bool'), ('notes', 'string'), ('stf_fn_shift', 'bool'), ('usec_zero', 'bool')))
+
+# What record_to_row reads beyond what is always decoded, see mft.FIELDS
+COLUMN_FIELDS = frozenset(('fn_all',))
+
+NUMPY_TYPES = {'int64': 'i8', 'bool': '?', 'timestamp': 'i8', 'string': 'S'}
+
+
+def available():
+    return pyarrow is not None or numpy is not None
+
+
+def epoch_usec(windows_time):
+    """Microseconds since the Unix epoch of a WindowsTime, exactly, without going through a float"""
+    if windows_time.filetime == 0:
+        return 0
+    return (windows_time.filetime - mftutils.EPOCH_FILETIME) // 10
+
+
+def record_to_row(record):
+    """Return a MFT record as a tuple of values in SCHEMA order"""
+
+    good = record.magic == 0x454c4946
+    row = [record.recordnum, good, hasattr(record, 'baad'), bool(record.flags & 0x0001),
+           bool(record.flags & 0x0002), record.seq]
+
+    if not good:
+        return tuple(row + [-1, -1, record.filename, ''] + [0] * 8 + [-1, -1, 0, 0] +
+                     [False] * len(ATTRIBUTE_FIELDS) + [False, record.notes, False, False])
+
+    if record.fncnt > 0:
+        fn = record.fn_attrs[0]
+        row.extend([fn.par_ref, fn.par_seq, record.filename, fn.name])
+    else:
+        fn = None
+        row.extend([-1, -1, record.filename, ''])
+
+    if hasattr(record, 'si'):
+        row.extend([epoch_usec(getattr(record.si, name)) for name in mftutils.TIME_FIELDS])
+    else:
+        row.extend([0] * 4)
+
+    if fn is not None:
+        row.extend([epoch_usec(getattr(fn, name)) for name in mftutils.TIME_FIELDS])
+        row.extend([fn.alloc_fsize, fn.real_fsize])
+    else:
+        row.extend([0] * 4)
+        row.extend([-1, -1])
+
+    row.extend([record.fncnt, record.ads])
+
+    for name in ATTRIBUTE_FIELDS:
+        if name == 'fn':
+            row.append(record.fncnt > 0)
+        elif name == 'data':
+            row.append(record.datacnt > 0)
+        else:
+            row.append(hasattr(record, name))
+
+    row.extend([hasattr(record, 'fixup_failed'), record.notes, hasattr(record, 'stf_fn_shift'),
+                hasattr(record, 'usec_zero')])
+
+    return tuple(row)
+
+
+class ColumnWriter:
+    """Write rows from record_to_row to a Parquet file, or to a NumPy .npz file without pyarrow
+
+    Rows are held until there are row_group_records of them and then written as one Parquet row group. A .npz
+    file can only be written in one go, so without pyarrow each batch is converted to compact NumPy arrays and
+    the file is written on close."""
+
+    def __init__(self, filename, row_group_records=ROW_GROUP_RECORDS):
+        if not available():
+            raise ImportError('Columnar output needs pyarrow or numpy')
+
+        self.filename = filename
+        self.row_group_records = row_group_records
+        self.rows = []
+
+        if pyarrow is not None:
+            self.format = 'parquet'
+            self.types = {'int64': pyarrow.int64(), 'bool': pyarrow.bool_(), 'timestamp': pyarrow.timestamp('us'),
+                          'string': pyarrow.string()}
+            self.schema = pyarrow.schema([pyarrow.field(name, self.types[kind]) for (name, kind) in SCHEMA])
+            self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+        else:
+            self.format = 'npz'
+            self.batches = dict((name, []) for (name, _) in SCHEMA)
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_records:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        columns = zip(*self.rows)
+        self.rows = []
+
+        if self.format == 'parquet':
+            arrays = [pyarrow.array(column, type=self.types[kind]) for (column, (_, kind)) in zip(columns, SCHEMA)]
+            self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        else:
+            for (column, (name, kind)) in zip(columns, SCHEMA):
+                self.batches[name].append(numpy.array(column, dtype=NUMPY_TYPES[kind]))
+
+    def close(self):
+        self.flush()
+
+        if self.format == 'parquet':
+            self.writer.close()
+            return
+
+        arrays = {}
+        for (name, kind) in SCHEMA:
+            if self.batches[name]:
+                arrays[name] = numpy.concatenate(self.batches[name])
+            else:
+                arrays[name] = numpy.array([], dtype=NUMPY_TYPES[kind])
+        self.batches = None
+
+        with open(self.filename, 'wb') as outfile:
+            numpy.savez_compressed(outfile, **arrays)
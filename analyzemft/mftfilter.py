@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+# Name: mftfilter.py
+#
+# Record filters: path prefixes, file name extensions, a time window and active records only. Each check is made
+# as soon as what it needs is known, so that records that are filtered out are decoded no further than that:
+# paths and extensions from the path table before a record is decoded, the in use flag after its header, and
+# times after its attributes, before any output is formatted.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import calendar
+import re
+from datetime import datetime
+
+import mftutils
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def parse_time(value, end_of_day=False):
+    """Return the FILETIME of a UTC date, YYYY-MM-DD, or date and time, YYYY-MM-DD HH:MM:SS
+
+    With end_of_day, a date alone is the last moment of that day rather than the first."""
+
+    for time_format in TIME_FORMATS:
+        try:
+            dt = datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+
+        filetime = calendar.timegm(dt.timetuple()) * 10000000 + mftutils.EPOCH_FILETIME
+        if end_of_day and time_format == '%Y-%m-%d':
+            filetime += 86400 * 10000000 - 1
+        return filetime
+
+    raise ValueError('Not a date, YYYY-MM-DD, or date and time, YYYY-MM-DD HH:MM:SS: %s' % value)
+
+
+def prefix_pattern(prefix, path_sep):
+    """Return a regular expression matching the paths at or below prefix
+
+    Either separator may be used in prefix, a leading drive letter is dropped, * matches any part of one path
+    component and ? any one character of it. Matching ignores case, as NTFS does."""
+
+    prefix = re.sub(r'^[A-Za-z]:', '', prefix.replace('\\', '/')).rstrip('/')
+    if not prefix.startswith('/'):
+        prefix = '/' + prefix
+
+    component = '[^%s]' % re.escape(path_sep)
+    pattern = ''
+    for char in prefix:
+        if char == '*':
+            pattern += component + '*'
+        elif char == '?':
+            pattern += component
+        elif char == '/':
+            pattern += re.escape(path_sep)
+        else:
+            pattern += re.escape(char)
+
+    return re.compile('%s(?:%s|$)' % (pattern, re.escape(path_sep)), re.IGNORECASE)
+
+
+def from_options(options, path_sep):
+    """Return the RecordFilter for the filter options, or None if there are none. Raises ValueError for a
+    malformed --since or --until."""
+
+    if not (options.path_prefix or options.extension or options.since or options.until or options.active_only):
+        return None
+
+    return RecordFilter(options.path_prefix, options.extension,
+                        parse_time(options.since) if options.since else None,
+                        parse_time(options.until, True) if options.until else None,
+                        options.time_attr, options.active_only, path_sep)
+
+
+class RecordFilter:
+    """Decides which records are output
+
+    A record is kept if its path is at or below one of path_prefixes, its name ends in one of extensions, one of
+    its times_from ('si', 'fn' or 'both') times is in [since, until], given as FILETIMEs, and with active_only,
+    it is in use. Checks that are not asked for always pass."""
+
+    def __init__(self, path_prefixes=None, extensions=None, since=None, until=None, times_from='both',
+                 active_only=False, path_sep='/'):
+        self.path_sep = path_sep
+        self.prefixes = [prefix_pattern(prefix, path_sep) for prefix in path_prefixes or ()]
+
+        self.extensions = None
+        if extensions:
+            self.extensions = set()
+            for value in extensions:
+                self.extensions.update('.' + ext.strip().lstrip('.').lower() for ext in value.split(',')
+                                       if ext.strip())
+
+        self.since = since
+        self.until = until
+        self.times_from = times_from
+        self.active_only = active_only
+
+        # The times of every $FILE_NAME attribute are checked, see mft.FIELDS
+        timed = since is not None or until is not None
+        self.fields = frozenset(('fn_all',)) if timed and times_from != 'si' else frozenset()
+
+    def match_path(self, path):
+        """Check the path and extension of a record, from the path table"""
+
+        if self.prefixes and not any(prefix.match(path) for prefix in self.prefixes):
+            return False
+
+        if self.extensions is not None:
+            name = path.rsplit(self.path_sep, 1)[-1]
+            dot = name.rfind('.')
+            if dot < 0 or name[dot:].lower() not in self.extensions:
+                return False
+
+        return True
+
+    def match_header(self, record):
+        """Check the in use flag of a record with only its header decoded"""
+        return not self.active_only or bool(record.flags & 0x0001)
+
+    def match_times(self, record):
+        """Check the times of a decoded record"""
+
+        if self.since is None and self.until is None:
+            return True
+
+        attrs = []
+        if self.times_from != 'fn' and hasattr(record, 'si'):
+            attrs.append(record.si)
+        if self.times_from != 'si' and hasattr(record, 'fn_attrs'):
+            attrs.extend(record.fn_attrs)
+
+        since = self.since if self.since is not None else 0
+        until = self.until if self.until is not None else 1 << 64
+        for attr in attrs:
+            for name in mftutils.TIME_FIELDS:
+                if since <= getattr(attr, name).filetime <= until:
+                    return True
+
+        return False
+
+    def match(self, record):
+        """Check a decoded record, with its path in record.filename"""
+        return self.match_path(record.filename) and self.match_header(record) and self.match_times(record)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# Name: mftmulti.py
+#
+# Batch mode: process every MFT file in a directory, or listed in a manifest, in one run. Images are handed to a
+# pool of worker processes, each image writes its own output files in a directory of its own, and an image that
+# fails is reported without stopping the rest of the batch.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from optparse import Values
+
+import mftsession
+
+# Options naming an output file. In batch mode each image writes the file of that name in its own directory.
+OUTPUT_OPTIONS = ('output', 'json', 'bodyfile', 'csvtimefile', 'columnar', 'cache', 'stats')
+
+
+def find_images(source):
+    """Return the MFT files of a batch: every file under the directory source, or the files listed in the
+    manifest source, one per line. Blank lines and lines starting with # are skipped, and relative paths are
+    relative to the manifest."""
+
+    if os.path.isdir(source):
+        images = []
+        for (dirpath, dirnames, filenames) in os.walk(source):
+            dirnames.sort()
+            images.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+        return images
+
+    base = os.path.dirname(os.path.abspath(source))
+    images = []
+    with open(source) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                images.append(os.path.join(base, line))
+
+    return images
+
+
+def image_tags(images, source):
+    """Return a name for each image, unique within the batch, made from its path below the batch directory or
+    the manifest's directory"""
+
+    root = os.path.abspath(source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source)))
+
+    tags = []
+    seen = set()
+    for image in images:
+        path = os.path.abspath(image)
+        tag = os.path.relpath(path, root)
+        if tag.startswith(os.pardir):
+            tag = os.path.splitdrive(path)[1].lstrip(os.sep)
+        tag = tag.replace(os.sep, '_').replace(':', '_')
+
+        unique = tag
+        n = 1
+        while unique in seen:
+            n += 1
+            unique = '%s-%d' % (tag, n)
+        seen.add(unique)
+        tags.append(unique)
+
+    return tags
+
+
+def image_options(options, image, output_dir):
+    """Return a copy of the batch options for one image, with its output files in output_dir"""
+
+    # The date formatter is a function and is set up again by set_formatters
+    values = dict((k, v) for (k, v) in vars(options).items() if not callable(v))
+    values.update({'filename': image, 'batch': None, 'jobs': 1})
+    for name in OUTPUT_OPTIONS:
+        if values.get(name) is not None and values[name] != '-':
+            values[name] = os.path.join(output_dir, os.path.basename(values[name]))
+
+    return Values(values)
+
+
+def has_file_record(reader):
+    """Return True if any record of the reader is a FILE record. Stops at the first one, which for an MFT is
+    record 0, its own."""
+
+    return any(record[:4] == 'FILE' for record in reader)
+
+
+def process_image(task):
+    """Process one MFT file. Returns (tag, records, seconds, error), with error None on success."""
+
+    (tag, options, output_dir) = task
+    start = time.time()
+    session = mftsession.MftSession()
+    try:
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        session.options = options
+        session.set_formatters()
+        session.open_files()
+        try:
+            # A file too short to hold a record, or with no FILE record in it, is not an MFT
+            if not has_file_record(session.reader):
+                return tag, 0, time.time() - start, 'not an MFT, no FILE record found'
+            session.process_mft_file()
+        finally:
+            session.close_files()
+            session.reader.close()
+            session.file_mft.close()
+    except SystemExit:
+        # open_files has already printed why
+        return tag, session.mftsize, time.time() - start, 'could not be opened'
+    except Exception:
+        return tag, session.mftsize, time.time() - start, traceback.format_exc().strip().splitlines()[-1]
+
+    return tag, session.mftsize, time.time() - start, None
+
+
+def run_batch(options):
+    """Process every image of the batch options.batch with options.jobs worker processes. Returns the exit
+    status: 0 if every image was processed, 1 if any failed."""
+
+    try:
+        images = find_images(options.batch)
+    except (IOError, OSError):
+        print "Unable to read batch: %s" % options.batch
+        return 1
+
+    output_dir = options.output_dir or '.'
+    tags = image_tags(images, options.batch)
+    tasks = [(tag, image_options(options, image, os.path.join(output_dir, tag)), os.path.join(output_dir, tag))
+             for (image, tag) in zip(images, tags)]
+
+    if options.jobs > 1:
+        pool = multiprocessing.Pool(options.jobs)
+        results = pool.imap_unordered(process_image, tasks)
+    else:
+        pool = None
+        results = (process_image(task) for task in tasks)
+
+    failed = 0
+    try:
+        for (done, (tag, records, seconds, error)) in enumerate(results, 1):
+            if error is None:
+                print '[%d/%d] ok      %s: %d records, %.1f s' % (done, len(tasks), tag, records, seconds)
+            else:
+                failed += 1
+                print '[%d/%d] FAILED  %s: %s' % (done, len(tasks), tag, error)
+            sys.stdout.flush()
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+
+    print 'Processed %d images, %d failed. Output is in %s' % (len(tasks), failed, output_dir)
+
+    return 1 if failed else 0
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# Name: mftpaths.py
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+from array import array
+
+import mft
+import mftutils
+
+# Record number of the root directory, "/"
+ROOT_RECORD = 5
+
+# Folder paths PathTable remembers, at most, and their total length in bytes
+FOLDER_CACHE_PATHS = 65536
+FOLDER_CACHE_BYTES = 16 * 1024 * 1024
+
+# Bytes used by a remembered folder path besides its characters: the str object and its LRU cache entry
+FOLDER_ENTRY_OVERHEAD = 160
+
+
+def path_entry(record):
+    """Return the (name, parent record number) used to build the path of a record from parse_path_record
+
+    The name is the Win32 one when the record has a short and a long name. Both are None when the record has no
+    $FILE_NAME attribute."""
+
+    name = par_ref = None
+    if record.fncnt == 1:
+        par_ref = record.fn_attrs[0]['par_ref']
+        name = record.fn_attrs[0]['name']
+    if record.fncnt > 1:
+        par_ref = record.fn_attrs[0]['par_ref']
+        for i in (0, record.fncnt - 1):
+            if record.fn_attrs[i]['nspace'] == 0x1 or record.fn_attrs[i]['nspace'] == 0x3:
+                name = record.fn_attrs[i]['name']
+        if name is None:
+            name = record.fn_attrs[record.fncnt - 1]['name']
+
+    return name, par_ref
+
+
+class PathTable:
+    """Parent pointers for every record in the MFT, with full paths built on request
+
+    Only the name and parent record number of each record are kept. Full paths are built without recursion when
+    they are asked for. The paths of recently used directories, the records that are some other record's
+    parent, are remembered in an LRU cache of at most FOLDER_CACHE_PATHS paths and FOLDER_CACHE_BYTES bytes, so
+    memory grows with the number of records rather than the length of their paths. A file's path is its folder's
+    path plus its name.
+
+    The paths are the same as those analyzeMFT has always produced:
+        record with no $FILE_NAME attribute                 NoFNRecord
+        parent in the root directory                        /name
+        parent not in the MFT                               Orphan/name
+        parent is the record itself                         ORPHAN/name
+    A longer parent loop is broken where it is found, at the record whose parent is already on the path being
+    built, and that record is given an ORPHAN/name path."""
+
+    def __init__(self, path_sep='/'):
+        self.path_sep = path_sep
+        # name is None for records without a $FILE_NAME attribute
+        self.names = []
+        self.parents = array('l')
+        self.folders = mftutils.LRUCache(FOLDER_CACHE_PATHS, FOLDER_CACHE_BYTES)
+        # (records, bytes) of the last measure of names and parents, which only change as records are added
+        self.table_footprint = (0, 0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, par_ref):
+        """Add the next record. Records must be added in record number order."""
+        self.names.append(name)
+        self.parents.append(par_ref if name is not None else -1)
+
+    def resolve(self, recordnum):
+        """Return the full path of a record"""
+        return self._path(recordnum, recordnum in self.folders)
+
+    def footprint(self):
+        """Return the approximate number of bytes the table uses now
+
+        The names and parents are only measured again when records have been added since. The remembered folder
+        paths are counted at what their cache holds, which never goes past its bounds."""
+
+        if self.table_footprint[0] != len(self.names):
+            self.table_footprint = (len(self.names), mftutils.footprint(self.names) +
+                                    self.parents.buffer_info()[1] * self.parents.itemsize)
+
+        return self.table_footprint[1] + self.folders.nbytes + len(self.folders) * FOLDER_ENTRY_OVERHEAD
+
+    def entry(self, recordnum):
+        """Return the (name, parent record number) of a record, or None if it is not in the MFT"""
+        if recordnum < 0 or recordnum >= len(self.names):
+            return None
+        return self.names[recordnum], self.parents[recordnum]
+
+    def _path(self, recordnum, remember):
+        folders = self.folders
+
+        # Walk up the parents until reaching a path that is already known or can be worked out from the record
+        # alone. chain holds the records passed on the way up.
+        chain = []
+        on_chain = set()
+        n = recordnum
+        while n not in folders:
+            entry = self.entry(n)
+            if entry is None:
+                path = 'Orphan'
+                break
+
+            (name, par_ref) = entry
+            if name is None:
+                path = 'NoFNRecord'
+            elif par_ref == ROOT_RECORD:
+                path = self.path_sep + name
+            elif par_ref == n or par_ref in on_chain:
+                path = 'ORPHAN' + self.path_sep + name
+            else:
+                chain.append((n, name))
+                on_chain.add(n)
+                n = par_ref
+                continue
+
+            if n != recordnum or remember:
+                folders[n] = path
+            break
+        else:
+            path = folders[n]
+
+        # Back down again, adding a name for each level
+        for (n, name) in reversed(chain):
+            path = path + self.path_sep + name
+            if n != recordnum or remember:
+                folders[n] = path
+
+        return path
+
+
+class LazyPathTable(PathTable):
+    """A PathTable that reads the records it needs from a mftreader reader as it goes
+
+    Resolving a path decodes only the record and its parent chain. The names, parents and folder paths are kept
+    in LRU caches of cache_size entries, so memory stays bounded however many lookups are made."""
+
+    def __init__(self, reader, path_sep='/', cache_size=4096):
+        PathTable.__init__(self, path_sep)
+        self.reader = reader
+        self.entries = mftutils.LRUCache(cache_size)
+        self.folders = mftutils.LRUCache(cache_size)
+
+    def __len__(self):
+        return len(self.reader)
+
+    def add(self, name, par_ref):
+        raise TypeError('Records are read from the MFT as they are needed')
+
+    def entry(self, recordnum):
+        if recordnum < 0 or recordnum >= len(self.reader):
+            return None
+
+        entry = self.entries.get(recordnum)
+        if entry is None:
+            (name, par_ref) = path_entry(mft.parse_path_record(self.reader.record(recordnum)))
+            entry = (name, par_ref if name is not None else -1)
+            self.entries[recordnum] = entry
+
+        return entry
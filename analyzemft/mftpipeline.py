@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# Name: mftpipeline.py
+#
+# Pipelined output: decoded records are handed over in batches to one writer thread per output, which formats
+# and writes them while the main thread goes on decoding. Each writer has a bounded queue, so decoding waits
+# for the slowest output rather than piling up records in memory.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import Queue
+import sys
+import threading
+from timeit import default_timer as clock
+
+# Records handed to the writers at a time
+PIPELINE_BATCH_RECORDS = 1024
+
+# Batches waiting in the queue of each writer before decoding waits for it
+PIPELINE_QUEUE_BATCHES = 8
+
+
+class OutputWriter(threading.Thread):
+    """A thread that formats and writes one output
+
+    Takes batches of (record, formatted output) pairs from its queue. When the formatted output of a record is
+    there, as it is with --jobs, item index of it is written; otherwise the record is formatted with format_func.
+    write_func writes a whole batch of formatted values. Once an error is raised, the rest of the batches are
+    dropped and the error is kept for OutputPipeline.close to raise. The time spent is kept in seconds, and only
+    added to stats by OutputPipeline.close once the thread has finished, as the main thread updates stats too."""
+
+    def __init__(self, stage, index, format_func, write_func, stats=None, queue_batches=PIPELINE_QUEUE_BATCHES):
+        threading.Thread.__init__(self, name='analyzeMFT ' + stage)
+        self.daemon = True
+        self.stage = stage
+        self.index = index
+        self.format_func = format_func
+        self.write_func = write_func
+        self.stats = stats
+        self.queue = Queue.Queue(queue_batches)
+        self.error = None
+        self.seconds = 0.0
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                continue
+
+            start = clock()
+            try:
+                self.write_func([self.format_func(record) if formatted is None else formatted[self.index]
+                                 for (record, formatted) in batch])
+            except Exception:
+                self.error = sys.exc_info()
+            self.seconds += clock() - start
+
+
+class OutputPipeline:
+    """Hands records to a set of OutputWriter threads, batch_records at a time"""
+
+    def __init__(self, writers, batch_records=PIPELINE_BATCH_RECORDS):
+        self.writers = writers
+        self.batch_records = batch_records
+        self.batch = []
+        for writer in writers:
+            writer.start()
+
+    def put(self, record, formatted=None):
+        self.batch.append((record, formatted))
+        if len(self.batch) >= self.batch_records:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        # Every writer gets the same batch, and put waits while a writer's queue is full
+        for writer in self.writers:
+            writer.queue.put(self.batch)
+        self.batch = []
+
+    def close(self):
+        """Write the rest of the records, wait for the writers to finish, and raise the first writer error"""
+
+        self.flush()
+        for writer in self.writers:
+            writer.queue.put(None)
+        for writer in self.writers:
+            writer.join()
+            if writer.stats is not None:
+                writer.stats.add(writer.stage, writer.seconds)
+
+        for writer in self.writers:
+            if writer.error is not None:
+                raise writer.error[0], writer.error[1], writer.error[2]
@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+
+# Name: mftreader.py
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import bisect
+import bz2
+import gzip
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import mft
+import mftrecord
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Record size used when it cannot be worked out from the MFT itself
+DEFAULT_RECORD_SIZE = 1024
+
+# Size of the blocks BlockReader and ImageReader read, rounded down to a whole number of records
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Bytes per sector, sectors per cluster, the first cluster of the MFT and clusters per MFT record from an NTFS
+# boot sector
+BOOT_SECTOR = struct.Struct("<11xHB34xQ8xb")
+
+# Type, length, name length, name offset, starting VCN, record number (48 bits) and sequence number of an
+# attribute list entry
+ATTRIBUTE_LIST_ENTRY = struct.Struct("<IHBBQIHH")
+
+# Leading bytes of the compressed formats open_mft reads
+COMPRESSION_MAGIC = (
+    ('gzip', '\x1f\x8b'),
+    ('bzip2', 'BZh'),
+    ('xz', '\xfd7zXZ\x00'),
+    ('zstd', '\x28\xb5\x2f\xfd'),
+)
+
+# Magic number and allocated size from the header of a FILE record
+FILE_HEADER = struct.Struct("<I24xI")
+
+
+def parse_boot_sector(boot_sector):
+    """Return (cluster size, first cluster of the MFT, record size) from an NTFS boot sector, or None if it is
+    not one"""
+
+    if len(boot_sector) < 512 or boot_sector[3:11] != 'NTFS    ':
+        return None
+
+    (sector_size, sectors_per_cluster, mft_lcn, clusters_per_record) = BOOT_SECTOR.unpack_from(boot_sector)
+
+    # Counts above 128 are 2 to the power of 256 minus the count, used for clusters of 64 KB and more
+    if sectors_per_cluster > 0x80:
+        sectors_per_cluster = 1 << (256 - sectors_per_cluster)
+    cluster_size = sectors_per_cluster * sector_size
+
+    # A negative count is the log2 of the record size in bytes, used when a record is smaller than a cluster
+    if clusters_per_record < 0:
+        record_size = 1 << -clusters_per_record
+    else:
+        record_size = clusters_per_record * cluster_size
+
+    return cluster_size, mft_lcn, record_size
+
+
+def is_volume_image(file_mft, offset=0):
+    """Return whether a file holds an NTFS volume, rather than a MFT, at offset"""
+
+    position = file_mft.tell()
+    file_mft.seek(offset)
+    boot_sector = file_mft.read(512)
+    file_mft.seek(position)
+
+    return parse_boot_sector(boot_sector) is not None
+
+
+def detect_record_size(file_mft):
+    """Return the record size of a MFT file from the allocated size in its first FILE record
+
+    Records are 1024 bytes on most volumes and 4096 bytes on some with 4K sectors. Falls back to 1024 when the
+    first record is not a good FILE record or does not hold a sensible size."""
+
+    position = file_mft.tell()
+    file_mft.seek(0)
+    header = file_mft.read(FILE_HEADER.size)
+    file_mft.seek(position)
+
+    if len(header) < FILE_HEADER.size:
+        return DEFAULT_RECORD_SIZE
+
+    (magic, alloc_size) = FILE_HEADER.unpack(header)
+    # Allocated sizes are a power of two, 256 bytes or more
+    if magic != 0x454c4946 or alloc_size < 256 or alloc_size > 65536 or alloc_size & (alloc_size - 1):
+        return DEFAULT_RECORD_SIZE
+
+    return alloc_size
+
+
+def compression(file_mft):
+    """Return the compression of a file, 'gzip', 'bzip2', 'xz' or 'zstd', from its first bytes, or None"""
+
+    position = file_mft.tell()
+    file_mft.seek(0)
+    head = file_mft.read(8)
+    file_mft.seek(position)
+
+    for (name, magic) in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+
+    return None
+
+
+def bzip2_blocks(file_mft):
+    """Yield the decompressed data of a bzip2 file in blocks, including files of several streams, as written by
+    pbzip2 and other parallel compressors"""
+
+    decompressor = bz2.BZ2Decompressor()
+    while True:
+        block = file_mft.read(BLOCK_SIZE)
+        if not block:
+            break
+
+        while block:
+            try:
+                data = decompressor.decompress(block)
+            except EOFError:  # The last stream ended exactly at the end of the previous block
+                decompressor = bz2.BZ2Decompressor()
+                continue
+            if data:
+                yield data
+
+            # Data left over once a stream ends is the start of the next one
+            block = decompressor.unused_data
+            if block:
+                decompressor = bz2.BZ2Decompressor()
+
+
+def spool(file_mft, kind):
+    """Decompress a compressed MFT file into a temporary file and return it, ready to be memory mapped
+
+    The MFT is decompressed once, in a single pass, and both the path table pass and the decoding pass then read
+    the temporary file. It is deleted when it is closed. tempfile puts it in $TMPDIR."""
+
+    spool_file = tempfile.NamedTemporaryFile(prefix='analyzemft-', suffix='.mft')
+    try:
+        if kind == 'gzip':
+            shutil.copyfileobj(gzip.GzipFile(fileobj=file_mft, mode='rb'), spool_file, BLOCK_SIZE)
+        elif kind == 'bzip2':
+            for block in bzip2_blocks(file_mft):
+                spool_file.write(block)
+        elif kind == 'xz':
+            shutil.copyfileobj(lzma.LZMAFile(file_mft), spool_file, BLOCK_SIZE)
+        else:
+            zstandard.ZstdDecompressor().copy_stream(file_mft, spool_file, BLOCK_SIZE, BLOCK_SIZE)
+        spool_file.flush()
+    except:
+        spool_file.close()
+        raise
+
+    spool_file.seek(0)
+    return spool_file
+
+
+def open_mft(filename):
+    """Open a MFT file for open_reader. A compressed file, gzip, bzip2, xz or zstd, is decompressed to a
+    temporary file by spool, and that is returned instead. Raises ImportError when the module that reads the
+    compression, lzma or zstandard, is not installed."""
+
+    file_mft = open(filename, 'rb')
+    kind = compression(file_mft)
+    if kind is None:
+        return file_mft
+
+    try:
+        if kind == 'xz' and lzma is None:
+            raise ImportError('Reading xz compressed files needs the lzma module, backports.lzma on Python 2')
+        if kind == 'zstd' and zstandard is None:
+            raise ImportError('Reading zstd compressed files needs the zstandard module')
+        return spool(file_mft, kind)
+    finally:
+        file_mft.close()
+
+
+def open_reader(file_mft, record_size=None, image_offset=None):
+    """Return a reader for a MFT file, memory mapped where possible
+
+    An NTFS volume image is read through ImageReader instead, from the volume at image_offset in the file or at
+    its start when it begins with an NTFS boot sector. The record size is detected when it is not given."""
+
+    if image_offset is None and is_volume_image(file_mft):
+        image_offset = 0
+    if image_offset is not None:
+        return ImageReader(file_mft, image_offset, record_size)
+
+    if record_size is None:
+        record_size = detect_record_size(file_mft)
+
+    try:
+        return MmapReader(file_mft, record_size)
+    except (EnvironmentError, OverflowError):
+        # Files that cannot be mapped, or are too large for the address space of a 32 bit Python
+        return BlockReader(file_mft, record_size)
+
+
+class MmapReader:
+    """Hand out the records of a MFT file as zero-copy views of a read only memory map of the file
+
+    The views are Python 2 buffer objects, which is what struct.unpack_from and the attribute decoders in mft
+    work on. Nothing is copied until a decoder pulls a field out of the record."""
+
+    def __init__(self, file_mft, record_size=1024):
+        self.record_size = record_size
+
+        size = os.fstat(file_mft.fileno()).st_size
+        # A trailing partial record is ignored
+        self.num_records = size // record_size
+
+        # mmap refuses to map an empty file
+        if size > 0:
+            self.map = mmap.mmap(file_mft.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = None
+
+    def __len__(self):
+        return self.num_records
+
+    def __iter__(self):
+        return self.records()
+
+    def record(self, recordnum):
+        """Return the view of a single record"""
+
+        if recordnum < 0 or recordnum >= self.num_records:
+            raise IndexError('Record number %d is outside the MFT' % recordnum)
+
+        return buffer(self.map, recordnum * self.record_size, self.record_size)
+
+    def records(self, start=0, stop=None):
+        """Yield views of the records in [start, stop), in order"""
+
+        if stop is None or stop > self.num_records:
+            stop = self.num_records
+
+        for offset in xrange(start * self.record_size, stop * self.record_size, self.record_size):
+            yield buffer(self.map, offset, self.record_size)
+
+    def view(self, start, stop):
+        """Return one view of the contiguous records in [start, stop)"""
+
+        stop = min(stop, self.num_records)
+        return buffer(self.map, start * self.record_size, (stop - start) * self.record_size)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class BlockReader:
+    """Hand out the records of a MFT file from large blocks read with one read call each
+
+    For files that cannot be memory mapped. Blocks are a whole number of records, so each starts on a record
+    boundary, and records are handed out as views into the block they are in."""
+
+    def __init__(self, file_mft, record_size=1024, block_size=BLOCK_SIZE):
+        self.file_mft = file_mft
+        self.record_size = record_size
+        self.block_records = max(1, block_size // record_size)
+
+        size = os.fstat(file_mft.fileno()).st_size
+        # A trailing partial record is ignored
+        self.num_records = size // record_size
+
+    def __len__(self):
+        return self.num_records
+
+    def __iter__(self):
+        return self.records()
+
+    def _read(self, start, stop):
+        self.file_mft.seek(start * self.record_size)
+        return self.file_mft.read((stop - start) * self.record_size)
+
+    def record(self, recordnum):
+        """Return a single record"""
+
+        if recordnum < 0 or recordnum >= self.num_records:
+            raise IndexError('Record number %d is outside the MFT' % recordnum)
+
+        return self._read(recordnum, recordnum + 1)
+
+    def records(self, start=0, stop=None):
+        """Yield views of the records in [start, stop), in order"""
+
+        if stop is None or stop > self.num_records:
+            stop = self.num_records
+
+        for block_start in xrange(start, stop, self.block_records):
+            block_stop = min(block_start + self.block_records, stop)
+            block = self._read(block_start, block_stop)
+            for offset in xrange(0, len(block) - self.record_size + 1, self.record_size):
+                yield buffer(block, offset, self.record_size)
+
+    def view(self, start, stop):
+        """Return the contiguous records in [start, stop)"""
+
+        return self._read(start, min(stop, self.num_records))
+
+    def close(self):
+        pass
+
+
+def image_runs(dataruns, cluster_size, image_offset, start=0):
+    """Return the runs of dataruns from mft.unpack_dataruns as [(byte offset in the attribute, byte offset in the
+    image or None if sparse, length in bytes), ...], for attribute data that starts start bytes in"""
+
+    runs = []
+    for (length, lcn) in mft.iter_runs(dataruns):
+        length *= cluster_size
+        # A sparse run, which a MFT should never have, reads as zeros
+        runs.append((start, image_offset + lcn * cluster_size if lcn is not None else None, length))
+        start += length
+
+    return runs
+
+
+def is_mft_data(atr_record):
+    """Return whether a decoded attribute header is a non-resident, unnamed $DATA attribute"""
+    return atr_record['type'] == 0x80 and atr_record['nlen'] == 0 and atr_record['res'] != 0
+
+
+class ImageReader(BlockReader):
+    """Hand out the records of the $MFT of an NTFS volume image, read straight from the clusters of the image
+
+    The boot sector gives the cluster size, the record size and the first cluster of the MFT. Record 0, the MFT's
+    own record, is read from there, and the runlist of its $DATA attribute says where the rest of the MFT is,
+    including runs kept in other records and listed in its attribute list. Records are read a block at a time,
+    with a seek and a read per run, and the MFT is never copied out of the image. Raises ValueError when there
+    is no NTFS volume at offset, or its MFT cannot be found. Only where _read finds the records differs from
+    BlockReader."""
+
+    def __init__(self, file_mft, offset=0, record_size=None, block_size=BLOCK_SIZE):
+        self.file_mft = file_mft
+        self.offset = offset
+
+        file_mft.seek(offset)
+        boot = parse_boot_sector(file_mft.read(512))
+        if boot is None:
+            raise ValueError('No NTFS boot sector at offset %d' % offset)
+
+        (self.cluster_size, mft_lcn, boot_record_size) = boot
+        self.record_size = record_size or boot_record_size
+        self.block_records = max(1, block_size // self.record_size)
+
+        # Just record 0 until its runlist is known
+        self._set_runs([(0, offset + mft_lcn * self.cluster_size, self.record_size)])
+
+        extents = self._mft_extents()
+        self._set_runs(self._extent_runs(extents))
+
+        # The data size of $DATA, in whole records, as far as the runs go
+        size = min(extent['realsize'] for extent in extents if extent['start_vcn'] == 0)
+        self.num_records = min(self.num_records, size // self.record_size)
+
+    def _set_runs(self, runs):
+        self.runs = runs
+        self.run_starts = [run[0] for run in runs]
+        self.num_records = sum(run[2] for run in runs) // self.record_size
+
+    def _extent_runs(self, extents):
+        """Return the runs of the $DATA extents, in the order of their starting VCNs"""
+
+        runs = []
+        for extent in sorted(extents, key=lambda extent: extent['start_vcn']):
+            runs.extend(image_runs(extent['dataruns'], self.cluster_size, self.offset,
+                                   extent['start_vcn'] * self.cluster_size))
+
+        return runs
+
+    def _mft_record(self, recordnum):
+        """Return the header and fixed up contents of record recordnum of the MFT"""
+
+        if recordnum >= self.num_records:
+            raise ValueError('MFT record %d is past the runs found so far' % recordnum)
+
+        record = mftrecord.MftRecord()
+        raw_record = self.record(recordnum)
+        mft.decode_mft_header(record, raw_record)
+        if record.magic != 0x454c4946:
+            raise ValueError('MFT record %d is not a FILE record' % recordnum)
+
+        return record, mft.apply_fixup(record, raw_record)
+
+    @staticmethod
+    def _attributes(record, raw_record):
+        """Yield (offset, decoded header) for each attribute of a record"""
+
+        read_ptr = record.attr_off
+        while read_ptr + 8 <= len(raw_record):
+            atr_record = mft.decode_atr_header(raw_record, read_ptr)
+            if atr_record['type'] == 0xffffffff or atr_record['len'] <= 0:
+                break
+            yield read_ptr, atr_record
+            read_ptr += atr_record['len']
+
+    def _mft_extents(self):
+        """Return the decoded headers of the unnamed $DATA attributes of the MFT, with their runlists"""
+
+        (record, raw_record) = self._mft_record(0)
+
+        extents = []
+        attribute_list = None
+        for (read_ptr, atr_record) in self._attributes(record, raw_record):
+            if atr_record['type'] == 0x20:
+                attribute_list = self._attribute_list(raw_record, read_ptr, atr_record)
+            elif is_mft_data(atr_record):
+                extents.append(atr_record)
+
+        # A MFT too fragmented for one record has the rest of its runs in extension records. They are listed in
+        # VCN order, so each is within the runs found before it.
+        seen = set([0])
+        for recordnum in attribute_list or ():
+            if recordnum in seen:
+                continue
+            seen.add(recordnum)
+
+            self._set_runs(self._extent_runs(extents))
+            (ext_record, ext_raw_record) = self._mft_record(recordnum)
+            extents.extend(atr_record for (_, atr_record) in self._attributes(ext_record, ext_raw_record)
+                           if is_mft_data(atr_record))
+
+        if not any(extent['start_vcn'] == 0 for extent in extents):
+            raise ValueError('No $DATA attribute in the $MFT record')
+
+        return extents
+
+    def _attribute_list(self, raw_record, read_ptr, atr_record):
+        """Return the numbers of the records that the attribute list of the MFT says hold $DATA extents"""
+
+        if atr_record['res'] == 0:
+            start = read_ptr + atr_record['soff']
+            content = bytes(raw_record[start:start + atr_record['ssize']])
+        else:
+            (_, dataruns, _) = mft.unpack_dataruns(
+                raw_record[read_ptr + atr_record['run_off']:read_ptr + atr_record['len']])
+            runs = image_runs(dataruns, self.cluster_size, self.offset)
+            content = self._read_runs(runs, [run[0] for run in runs], 0, atr_record['realsize'])
+
+        recordnums = []
+        pos = 0
+        while pos + ATTRIBUTE_LIST_ENTRY.size <= len(content):
+            (atype, length, nlen, _, _, ref_low, ref_high, _) = ATTRIBUTE_LIST_ENTRY.unpack_from(content, pos)
+            if length == 0:
+                break
+            if atype == 0x80 and nlen == 0:
+                recordnums.append(ref_low | (ref_high << 32))
+            pos += length
+
+        return recordnums
+
+    def _read_runs(self, runs, run_starts, start, length):
+        """Read length bytes from start bytes into the data described by runs, which start at run_starts"""
+
+        end = start + length
+        chunks = []
+        for i in xrange(max(0, bisect.bisect_right(run_starts, start) - 1), len(runs)):
+            (run_start, image_offset, run_length) = runs[i]
+            if run_start >= end:
+                break
+            low = max(start, run_start)
+            high = min(end, run_start + run_length)
+            if high <= low:
+                continue
+            if image_offset is None:
+                chunks.append('\x00' * (high - low))
+            else:
+                self.file_mft.seek(image_offset + low - run_start)
+                chunks.append(self.file_mft.read(high - low))
+
+        return ''.join(chunks)
+
+    def _read(self, start, stop):
+        return self._read_runs(self.runs, self.run_starts, start * self.record_size,
+                               (stop - start) * self.record_size)
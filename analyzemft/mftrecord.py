@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# Name: mftrecord.py
+#
+# Compact containers for decoded MFT records. A decoded record used to be a dict with tuple keys such as
+# ('fn', 0) and nested dicts for $STANDARD_INFORMATION and $FILE_NAME. These classes keep the same keys but
+# store the values in __slots__, which takes a fraction of the memory when a whole MFT is kept with -s.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+
+class SlotRecord(object):
+    """Dict style access to the slots of a record, so record['si'] and 'si' in record keep working
+
+    A slot that has never been assigned is a missing key. Keys that are not valid attribute names are mapped
+    through _key_to_slot, and keys of the form (name, i) index the list in the slot _list_slots[name]."""
+
+    __slots__ = ()
+
+    _key_to_slot = {}
+    _list_slots = {}
+
+    def _slot(self, key):
+        if isinstance(key, tuple):
+            raise KeyError(key)
+        slot = self._key_to_slot.get(key, key)
+        if slot not in self.__slots__:
+            raise KeyError(key)
+        return slot
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and key[0] in self._list_slots:
+            try:
+                return getattr(self, self._list_slots[key[0]])[key[1]]
+            except (AttributeError, IndexError):
+                raise KeyError(key)
+
+        try:
+            return getattr(self, self._slot(key))
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple) and key[0] in self._list_slots:
+            slot = self._list_slots[key[0]]
+            values = getattr(self, slot, None)
+            if values is None:
+                values = []
+                setattr(self, slot, values)
+            if key[1] == len(values):
+                values.append(value)
+            else:
+                values[key[1]] = value
+            return
+
+        setattr(self, self._slot(key), value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, self._slot(key))
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for (key, _) in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        slot_to_key = dict((slot, key) for (key, slot) in self._key_to_slot.items())
+        list_slots = dict((slot, name) for (name, slot) in self._list_slots.items())
+
+        items = []
+        for slot in self.__slots__:
+            if not hasattr(self, slot):
+                continue
+            value = getattr(self, slot)
+            if slot in list_slots:
+                items.extend(((list_slots[slot], i), v) for (i, v) in enumerate(value))
+            else:
+                items.append((slot_to_key.get(slot, slot), value))
+
+        return items
+
+    def copy(self):
+        duplicate = self.__class__.__new__(self.__class__)
+        duplicate.__setstate__(self.__getstate__())
+        return duplicate
+
+    # __slots__ classes need these to be pickled with protocols 0 and 1 (--jobs, the on-disk stores)
+    def __getstate__(self):
+        state = {}
+        for slot in self.__slots__:
+            if hasattr(self, slot):
+                value = getattr(self, slot)
+                state[slot] = list(value) if slot in self._list_slots.values() else value
+        return state
+
+    def __setstate__(self, state):
+        for (slot, value) in state.items():
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class StdInfoAttr(SlotRecord):
+    """Decoded $STANDARD_INFORMATION attribute"""
+
+    __slots__ = ('crtime', 'mtime', 'ctime', 'atime', 'dos', 'maxver', 'ver', 'class_id', 'own_id', 'sec_id',
+                 'quota', 'usn')
+
+
+class FileNameAttr(SlotRecord):
+    """Decoded $FILE_NAME attribute"""
+
+    __slots__ = ('par_ref', 'par_seq', 'crtime', 'mtime', 'ctime', 'atime', 'alloc_fsize', 'real_fsize', 'flags',
+                 'nlen', 'nspace', 'name')
+
+
+class MftRecord(SlotRecord):
+    """Decoded MFT record
+
+    record['fn', i], record['data', i] and record['data_name', i] are the i-th $FILE_NAME attribute, $DATA
+    attribute and ADS name. The anomaly flags keep their 'stf-fn-shift' and 'usec-zero' keys."""
+
+    __slots__ = (
+        # Header
+        'magic', 'upd_off', 'upd_cnt', 'lsn', 'seq', 'link', 'attr_off', 'flags', 'size', 'alloc_sizef',
+        'base_ref', 'base_seq', 'next_attrid', 'f1', 'recordnum', 'seq_number',
+        # Bookkeeping
+        'filename', 'notes', 'ads', 'fncnt', 'datacnt', 'baad', 'corrupt', 'fixup_failed', 'stf_fn_shift',
+        'usec_zero',
+        # Attributes
+        'si', 'al', 'objid', 'sd', 'volname', 'volinfo', 'indexroot', 'indexallocation', 'bitmap',
+        'reparsepoint', 'eainfo', 'ea', 'propertyset', 'loggedutility',
+        'fn_attrs', 'data_attrs', 'data_names',
+    )
+
+    _key_to_slot = {
+        'stf-fn-shift': 'stf_fn_shift',
+        'usec-zero': 'usec_zero',
+    }
+    _list_slots = {
+        'fn': 'fn_attrs',
+        'data': 'data_attrs',
+        'data_name': 'data_names',
+    }
+
+    def __init__(self):
+        self.filename = ''
+        self.notes = ''
+        self.ads = 0
+        self.fncnt = 0
+        self.datacnt = 0
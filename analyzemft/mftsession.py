@@ -9,20 +9,89 @@
 # Date: May 2013
 #
 
-VERSION = "v2.0.18"
+VERSION = "v2.0.20"
 
+import collections
 import csv
 import json
-import os
+import multiprocessing
+import sqlite3
 import sys
-from optparse import OptionParser
+from optparse import OptionParser, Values
 
 import mft
+import mftbatch
+import mftcache
+import mftcolumns
+import mftfilter
+import mftpaths
+import mftpipeline
+import mftreader
+import mftstats
+import mftutils
 
 
 SIAttributeSizeXP = 72
 SIAttributeSizeNT = 48
 
+# Write buffer for the JSON Lines output, which can run to several GB
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+# Decoded records and paths kept by the get_record and resolve_path lookups
+LOOKUP_CACHE_RECORDS = 1024
+
+# Number of records handed to a worker process at a time in --jobs mode
+JOB_CHUNK_RECORDS = 1024
+
+# Chunks in flight per worker process in --jobs mode. More are only handed out as the results are written, so a
+# slow output does not leave decoded chunks piling up in memory.
+JOB_CHUNKS_PER_WORKER = 2
+
+# Per worker process session for --jobs mode, set up by _init_worker
+_worker_session = None
+
+
+def _init_worker(options):
+    global _worker_session
+    _worker_session = MftSession()
+    _worker_session.options = options
+    _worker_session.set_formatters()
+    _worker_session.file_mft = open(options.filename, 'rb')
+    _worker_session.reader = mftreader.open_reader(_worker_session.file_mft, options.recordsize,
+                                                   options.image_offset)
+    _worker_session.keep_stats = options.progress or options.stats is not None
+    _worker_session.filter = mftfilter.from_options(options, _worker_session.path_sep)
+
+
+def _decode_chunk(chunk):
+    """Decode and format the records in [start, start + len(filenames)) of the MFT. Runs in a worker process."""
+    (start, filenames) = chunk
+    session = _worker_session
+    if session.keep_stats:
+        session.stats = mftstats.Stats(session.reader.record_size)
+
+    # The cache must hold every record, so while it is filled the filters are only checked after decoding
+    pushdown = session.options.cache is None
+
+    results = []
+    for (recordnum, record) in session.parse_records(start, start + len(filenames), filenames, pushdown):
+        if session.options.debug:
+            print record
+
+        matched = pushdown or session.filter is None or session.filter.match(record)
+        if matched:
+            formatted = session.format_output(record)
+            ads = [(record_ads if session.options.inmemory else None, session.format_output(record_ads))
+                   for record_ads in session.ads_records(record)]
+        else:
+            formatted = None
+            ads = []
+        # The records themselves are only needed back to keep them in memory or to fill the cache
+        keep = session.options.inmemory or session.options.cache is not None
+        results.append((recordnum, record if keep else None, matched, formatted, ads))
+
+    return results, session.stats.state() if session.stats is not None else None
+
 
 class MftSession:
     """Class to describe an entire MFT processing session"""
@@ -37,13 +106,20 @@ class MftSession:
 
 
     def __init__(self):
-        self.mft = {}
+        self.paths = None
+        self.records = mftutils.LRUCache(LOOKUP_CACHE_RECORDS)
+        self.names = None
+        self.cache = None
+        self.cache_hit = False
+        self.stats = None
+        self.filter = None
+        self.pipeline = None
         self.fullmft = {}
-        self.folders = {}
         self.debug = False
         self.mftsize = 0
 
-    def mft_options(self):
+    def mft_options(self, args=None):
+        """Parse the command line options, from sys.argv or, when using analyzeMFT as a library, from args"""
 
         parser = OptionParser()
         parser.set_defaults(inmemory=False, debug=False, UseLocalTimezone=False, UseGUI=False)
@@ -52,11 +128,20 @@ class MftSession:
                           help="report version and exit")
 
         parser.add_option("-f", "--file", dest="filename",
-                          help="read MFT from FILE", metavar="FILE")
+                          help="read MFT from FILE, which may be gzip, bzip2, xz or zstd compressed",
+                          metavar="FILE")
+
+        parser.add_option("--batch", dest="batch",
+                          help="process every MFT file in the directory SOURCE, or listed in the manifest file "
+                               "SOURCE, with --jobs images at a time", metavar="SOURCE")
+
+        parser.add_option("--output-dir", dest="output_dir",
+                          help="with --batch, write the output files of each MFT file to a directory of its own in "
+                               "DIR", metavar="DIR")
 
         parser.add_option("-j", "--json",
                           dest="json",
-                          help="File paths should use the windows path separator instead of linux")        
+                          help="write records to FILE as JSON Lines, one JSON object per line", metavar="FILE")
         
         parser.add_option("-o", "--output", dest="output",
                           help="write results to FILE", metavar="FILE")
@@ -78,6 +163,10 @@ class MftSession:
         parser.add_option("--bodyfull", action="store_true", dest="bodyfull",
                           help="Use full path name + filename rather than just filename")
 
+        parser.add_option("--columnar", dest="columnar",
+                          help="write typed columns to FILE, as Parquet if pyarrow is installed, else NumPy .npz",
+                          metavar="FILE")
+
         parser.add_option("-c", "--csvtimefile", dest="csvtimefile",
                           help="write CSV format timeline file", metavar="FILE")
 
@@ -91,18 +180,73 @@ class MftSession:
 
         parser.add_option("-s", "--saveinmemory",
                           action="store_true", dest="inmemory",
-                          help="Save a copy of the decoded MFT in memory. Do not use for very large MFTs")
+                          help="Save a copy of the decoded MFT in memory. Use --memory-limit for very large MFTs")
+
+        parser.add_option("--memory-limit", dest="memory_limit", type="int",
+                          help="With -s, keep at most MB megabytes of decoded records and paths in memory, and the "
+                               "rest in a temporary file", metavar="MB")
 
         parser.add_option("-p", "--progress",
                           action="store_true", dest="progress",
-                          help="Show systematic progress reports.")
+                          help="Report progress, throughput and damaged records on stderr every few seconds")
+
+        parser.add_option("--stats", dest="stats",
+                          help="write a JSON summary of the time spent in each stage, throughput and damaged record "
+                               "counts to FILE, - for stderr", metavar="FILE")
+
+        parser.add_option("--recordsize", dest="recordsize", type="int",
+                          help="MFT record size in bytes. Detected from the first record when not given",
+                          metavar="BYTES")
+
+        parser.add_option("--image-offset", dest="image_offset", type="int",
+                          help="read the $MFT of the NTFS volume that starts BYTES into FILE, such as a partition "
+                               "of a disk image. Volume images are recognised without it", metavar="BYTES")
+
+        parser.add_option("--cache", dest="cache",
+                          help="keep the decoded MFT in the SQLite database FILE, and reuse it on later runs over "
+                               "the same MFT", metavar="FILE")
+
+        parser.add_option("--jobs", dest="jobs", type="int", default=1,
+                          help="Decode records with N worker processes. Output order is unchanged. With --batch, "
+                               "process N MFT files at a time", metavar="N")
+
+        parser.add_option("--pipeline", action="store_true", dest="pipeline",
+                          help="format and write each output in a thread of its own while records are decoded")
+
+        parser.add_option("--path-prefix", action="append", dest="path_prefix",
+                          help="only output records at or below PATH, such as \\Users\\*\\AppData. * and ? match "
+                               "within one path component. May be given more than once", metavar="PATH")
+
+        parser.add_option("--extension", action="append", dest="extension",
+                          help="only output records whose name ends in one of the comma separated extensions EXT. "
+                               "May be given more than once", metavar="EXT")
+
+        parser.add_option("--since", dest="since",
+                          help="only output records with a time on or after TIME, YYYY-MM-DD or "
+                               "'YYYY-MM-DD HH:MM:SS' UTC", metavar="TIME")
+
+        parser.add_option("--until", dest="until",
+                          help="only output records with a time on or before TIME. A date alone includes the whole "
+                               "day", metavar="TIME")
+
+        parser.add_option("--time-attr", dest="time_attr", type="choice", choices=["si", "fn", "both"],
+                          default="both",
+                          help="check the times of $STANDARD_INFORMATION (si), $FILE_NAME (fn) or both against "
+                               "--since and --until", metavar="ATTR")
+
+        parser.add_option("--active-only", action="store_true", dest="active_only",
+                          help="only output records that are in use")
 
         parser.add_option("-w", "--windows-path",
                           action="store_true", dest="winpath",
                           help="File paths should use the windows path separator instead of linux")
         
         
-        (self.options, args) = parser.parse_args()
+        (self.options, args) = parser.parse_args(args)
+
+        self.set_formatters()
+
+    def set_formatters(self):
 
         self.path_sep = '\\' if self.options.winpath else '/'
 
@@ -126,19 +270,66 @@ class MftSession:
         #     print "-o <filename> or -b <filename> or -c <filename> required."
         #     sys.exit()
 
+        recordsize = self.options.recordsize
+        if recordsize is not None and (recordsize < 256 or recordsize & (recordsize - 1)):
+            print "Record size must be a power of two, 256 or more: %d" % recordsize
+            sys.exit()
+
         try:
-            self.file_mft = open(self.options.filename, 'rb')
+            self.file_mft = mftreader.open_mft(self.options.filename)
+            self.reader = mftreader.open_reader(self.file_mft, recordsize, self.options.image_offset)
+        except (ImportError, ValueError) as e:
+            print "Unable to open file: %s: %s" % (self.options.filename, e)
+            sys.exit()
         except:
             print "Unable to open file: %s" % self.options.filename
             sys.exit()
 
+        # Worker processes use the same record size rather than detecting it again
+        self.options.recordsize = self.reader.record_size
+
+        try:
+            self.filter = mftfilter.from_options(self.options, self.path_sep)
+        except ValueError as e:
+            print e
+            sys.exit()
+
+        if self.options.progress or self.options.stats is not None:
+            self.stats = mftstats.Stats(self.reader.record_size, len(self.reader), self.options.progress)
+
+        if self.options.memory_limit is not None:
+            if self.options.memory_limit <= 0:
+                print "Memory limit must be more than 0 MB: %d" % self.options.memory_limit
+                sys.exit()
+            self.fullmft = mftcache.RecordStore(self.options.memory_limit * 1024 * 1024, self.options.localtz)
+
+        if self.options.cache is not None:
+            try:
+                self.cache = mftcache.RecordCache(self.options.cache)
+            except sqlite3.OperationalError:
+                print "Unable to open cache: %s" % self.options.cache
+                sys.exit()
+            except sqlite3.DatabaseError:
+                print "Cache is not a SQLite database: %s" % self.options.cache
+                sys.exit()
+            self.cache_key = mftcache.cache_key(self.reader, self.options)
+            self.cache_hit = self.cache.matches(self.cache_key)
+
         if self.options.output is not None:
             try:
-                self.file_csv = csv.writer(open(self.options.output, 'wb'), dialect=csv.excel, quoting=1)
+                self.file_output = open(self.options.output, 'wb')
+                self.file_csv = csv.writer(self.file_output, dialect=csv.excel, quoting=1)
             except (IOError, TypeError):
                 print "Unable to open file: %s" % self.options.output
                 sys.exit()
         
+        if self.options.json is not None:
+            try:
+                self.file_json = open(self.options.json, 'w', OUTPUT_BUFFER_SIZE)
+            except (IOError, TypeError):
+                print "Unable to open file: %s" % self.options.json
+                sys.exit()
+
         if self.options.bodyfile is not None:
             try:
                 self.file_body = open(self.options.bodyfile, 'w')
@@ -153,212 +344,517 @@ class MftSession:
                 print "Unable to open file: %s" % self.options.csvtimefile
                 sys.exit()
 
-    # Provides a very rudimentary check to see if it's possible to store the entire MFT in memory
-    # Not foolproof by any means, but could stop you from wasting time on a doomed to failure run.
+        if self.options.columnar is not None:
+            try:
+                self.file_columns = mftcolumns.ColumnWriter(self.options.columnar)
+            except ImportError:
+                print "Columnar output needs pyarrow or numpy"
+                sys.exit()
+            except (IOError, TypeError):
+                print "Unable to open file: %s" % self.options.columnar
+                sys.exit()
+
+    def close_files(self):
+        """Flush and close the output files"""
+
+        for name in ('file_output', 'file_json', 'file_csv_time', 'file_body', 'file_columns', 'cache'):
+            outfile = getattr(self, name, None)
+            if outfile is not None:
+                outfile.close()
+                setattr(self, name, None)
+
     def sizecheck(self):
+        """Count the records in the MFT"""
 
-        # The number of records in the MFT is the size of the MFT / 1024
-        self.mftsize = long(os.path.getsize(self.options.filename)) / 1024
+        # The number of records in the MFT is the size of the MFT / the record size
+        self.mftsize = len(self.reader)
 
         if self.options.debug:
-            print 'There are %d records in the MFT' % self.mftsize
+            print 'There are %d records of %d bytes in the MFT' % (self.mftsize, self.reader.record_size)
 
-        if not self.options.inmemory:
-            return
+    def process_mft_file(self):
 
-        # The size of the full MFT is approximately the number of records * the avg record size
-        # Avg record size was determined empirically using some test data
-        sizeinbytes = self.mftsize * 4500
+        self.sizecheck()
 
-        if self.options.debug:
-            print 'Need %d bytes of memory to save into memory' % sizeinbytes
+        self.num_records = 0
 
+        if self.options.output is not None:
+            self.file_csv.writerow(mft.mft_to_csv(None, True, self.options))
+
+        # Only the parts of each record that the outputs read are decoded during the output pass. Records
+        # fetched afterwards, with get_record or find, are decoded in full again.
+        self.options.fields = self.output_fields()
         try:
-            arr = []
-            for i in range(0, sizeinbytes / 10):
-                arr.append(1)
+            if self.options.pipeline:
+                self.start_pipeline()
+                try:
+                    self.output_records()
+                finally:
+                    self.pipeline.close()
+                    self.pipeline = None
+            else:
+                self.output_records()
+        finally:
+            self.options.fields = None
+
+        self.write_stats()
+
+    def output_fields(self):
+        """Return the parts of each record that the outputs and filters read, see mft.FIELDS, or None to decode
+        whole records. Records kept with -s, cached or printed with -d are always decoded in full."""
+
+        options = self.options
+        if options.inmemory or options.cache is not None or options.debug:
+            return None
+
+        fields = set()
+        if options.output is not None:
+            fields |= mft.CSV_FIELDS
+        if options.json is not None:
+            fields |= mft.JSON_FIELDS
+        if options.csvtimefile is not None:
+            fields |= mft.L2T_FIELDS
+        if options.bodyfile is not None:
+            fields |= mft.BODY_FIELDS
+        if options.columnar is not None:
+            fields |= mftcolumns.COLUMN_FIELDS
+        if self.filter is not None:
+            fields |= self.filter.fields
+
+        return frozenset(fields)
+
+    def output_records(self):
+        """Decode every record and write it to the outputs"""
+
+        if self.options.jobs > 1 and not self.cache_hit:
+            self.prepare_paths()
+            for (recordnum, record, matched, formatted, ads) in self.parallel_parse_records():
+                self.num_records = recordnum
+                if self.cache is not None:
+                    self.timed('cache', self.cache.add, self.num_records, record)
+                if not matched:
+                    if self.stats is not None:
+                        self.stats.filtered()
+                    continue
+
+                self.do_output(record, formatted)
+                self.num_records += 1
+                for (record_ads, formatted_ads) in ads:
+                    self.do_output(record_ads, formatted_ads)
+
+            if self.cache is not None:
+                self.timed('cache', self.cache.finish, self.cache_key, self.paths)
+        elif self.batch_body():
+            self.output_body_batches()
+        else:
+            for record in self.iter_records():
+                self.do_output(record)
+
+    def batch_body(self):
+        """Return whether the bodyfile is written from mftbatch columns, see output_body_batches. It is when NumPy is
+        installed and the bodyfile is the only output, with no filters, cache, statistics, -s, -d, --pipeline or
+        --jobs."""
+
+        options = self.options
+        return (mftbatch.available() and options.bodyfile is not None and options.output is None and
+                options.json is None and options.csvtimefile is None and options.columnar is None and
+                self.filter is None and self.cache is None and self.stats is None and not options.inmemory and
+                not options.debug and not options.pipeline and options.jobs <= 1)
+
+    def output_body_batches(self):
+        """Write the bodyfile from the columns mftbatch decodes a batch of records at a time
+
+        Records that the columns describe completely are written straight from them. Every other record, such as
+        a BAAD record or one with alternate data streams, is decoded and written by mft_to_body as usual, so the
+        bodyfile is the same either way."""
+
+        full = self.options.bodyfull
+        if full:
+            self.prepare_paths()
+        else:
+            # Without full paths only the records decoded by mft_to_body look up a path, through a LazyPathTable
+            self.mftsize = len(self.reader)
+        # mft_to_body has always written the $STANDARD_INFORMATION ctime in place of the creation time
+        if self.options.bodystd:
+            fields = ('si_atime', 'si_mtime', 'si_ctime', 'si_ctime')
+        else:
+            fields = ('fn_atime', 'fn_mtime', 'fn_ctime', 'fn_crtime')
+
+        write = self.file_body.write
+        for (start, columns) in mftbatch.iter_batches(self.reader, localtz=self.options.localtz, names=not full):
+            simple = columns['simple'].tolist()
+            sizes = columns['real_fsize'].tolist()
+            names = columns.get('fn_name')
+            (atimes, mtimes, ctimes, crtimes) = [columns[field].tolist() for field in fields]
+
+            for i in xrange(len(simple)):
+                self.num_records = start + i
+                if not simple[i]:
+                    for (_, record) in self.parse_records(start + i, start + i + 1):
+                        self.do_output(record)
+                        for record_ads in self.ads_records(record):
+                            self.do_output(record_ads)
+                    continue
+
+                name = self.get_folder_path(start + i) if full else names[i]
+                write(mft.body_line(name, sizes[i], atimes[i], mtimes[i], ctimes[i], crtimes[i]))
+
+    def start_pipeline(self):
+        """Start a writer thread for each output, see mftpipeline. do_output then hands records to them."""
+
+        options = self.options
+        writers = []
+
+        # Each writer formats the records itself, or writes its item of the output from format_output
+        if options.output is not None:
+            writers.append(mftpipeline.OutputWriter('csv', 0, lambda record: mft.mft_to_csv(record, False, options),
+                                                    self.file_csv.writerows, self.stats))
+        if options.json is not None:
+            writers.append(mftpipeline.OutputWriter('json', 1, self.json_line,
+                                                    lambda lines: self.file_json.write(''.join(lines)), self.stats))
+        if options.csvtimefile is not None:
+            writers.append(mftpipeline.OutputWriter('l2t', 2, mft.mft_to_l2t,
+                                                    lambda lines: self.file_csv_time.write(''.join(lines)),
+                                                    self.stats))
+        if options.bodyfile is not None:
+            writers.append(mftpipeline.OutputWriter('body', 3,
+                                                    lambda record: mft.mft_to_body(record, options.bodyfull,
+                                                                                   options.bodystd),
+                                                    lambda lines: self.file_body.write(''.join(lines)), self.stats))
+        if options.columnar is not None:
+            writers.append(mftpipeline.OutputWriter('columnar', 4, mftcolumns.record_to_row,
+                                                    self.file_columns.writerows, self.stats))
+
+        self.pipeline = mftpipeline.OutputPipeline(writers)
+
+    def timed(self, stage, func, *args):
+        """Call func(*args), and add the time it takes to stage of self.stats when statistics are kept"""
+        if self.stats is None:
+            return func(*args)
+        return self.stats.timed(stage, func, *args)
+
+    def write_stats(self):
+        """Write the JSON summary of the run to the --stats file"""
+
+        if self.options.stats is None:
+            return
 
-        except MemoryError:
-            print 'Error: Not enough memory to store MFT in memory. Try running again without -s option'
-            sys.exit()
+        if self.options.stats == '-':
+            self.stats.write_summary(sys.stderr)
+            return
 
-    def process_mft_file(self):
+        try:
+            with open(self.options.stats, 'w') as outfile:
+                self.stats.write_summary(outfile)
+        except IOError:
+            print "Unable to open file: %s" % self.options.stats
 
-        self.sizecheck()
+    def prepare_paths(self):
+        """Set up the path table, from the cache when it matches or else by reading the whole MFT once"""
+
+        self.mftsize = len(self.reader)
+
+        # A matching cache already has the path table and the decoded records, with their paths
+        if self.cache_hit:
+            self.paths = self.timed('cache', self.cache.load_paths, self.path_sep)
+        else:
+            self.timed('paths', self.build_filepaths)
+            if self.cache is not None:
+                self.timed('cache', self.cache.start)
+
+        # The path table counts towards the memory limit of the records kept with -s
+        if self.options.memory_limit is not None:
+            self.fullmft.reserved = self.paths.footprint
+
+    def iter_records(self, ads=True):
+        """Yield the records of the MFT one at a time, in order, with their full paths in record.filename
+
+        With ads, each record with alternate data streams is followed by a copy of it per stream, named
+        path:stream. Nothing is kept once a record has been yielded, so memory use does not grow with the size of
+        the MFT beyond the path table. self.num_records is the position of the current record in the MFT."""
 
-        self.build_filepaths()
+        self.prepare_paths()
 
-        # reset the file reading
         self.num_records = 0
-        self.file_mft.seek(0)
-        raw_record = self.file_mft.read(1024)
 
-        if self.options.output is not None:
-            self.file_csv.writerow(mft.mft_to_csv(None, True, self.options))
+        if self.cache_hit:
+            records = self.cache.records(self.options.localtz)
+            if self.stats is not None:
+                records = self.stats.timed_iter('cache', records)
+            record_filter = self.filter
+        else:
+            # The cache must hold every record, so while it is filled the filters are only checked after decoding
+            records = self.parse_records(pushdown=self.cache is None)
+            record_filter = self.filter if self.cache is not None else None
 
-        while raw_record != "":
-            record = mft.parse_record(raw_record, self.options)
+        for (recordnum, record) in records:
+            self.num_records = recordnum
             if self.options.debug:
                 print record
 
-            record['filename'] = self.mft[self.num_records]['filename']
+            if self.cache_hit:
+                if self.stats is not None:
+                    self.stats.count(record)
+            elif self.cache is not None:
+                self.timed('cache', self.cache.add, self.num_records, record)
+
+            if record_filter is not None and not record_filter.match(record):
+                if self.stats is not None:
+                    self.stats.filtered()
+                continue
 
-            self.do_output(record)
+            yield record
 
             self.num_records += 1
 
-            if record['ads'] > 0:
-                for i in range(0, record['ads']):
-                    #                         print "ADS: %s" % (record['data_name', i])
-                    record_ads = record.copy()
-                    record_ads['filename'] = record['filename'] + ':' + record['data_name', i]
-                    self.do_output(record_ads)
+            if ads:
+                for record_ads in self.ads_records(record):
+                    yield record_ads
+
+        if self.cache is not None and not self.cache_hit:
+            self.timed('cache', self.cache.finish, self.cache_key, self.paths)
+
+    def parse_records(self, start=0, end=None, filenames=None, pushdown=True):
+        """Yield (position in the MFT, record) for records [start, end) of the MFT file, in order, with their full
+        paths in record.filename
+
+        The paths are taken from filenames, the paths of records [start, end), when it is given, and worked out
+        from the path table otherwise. With pushdown, records that self.filter leaves out are skipped as soon as
+        possible: on their path before they are decoded, on their flags before their attributes are decoded, and
+        on their times before they are formatted."""
+
+        stats = self.stats
+        record_filter = self.filter if pushdown else None
+
+        raw_records = self.reader.records(start, end)
+        if stats is not None:
+            raw_records = stats.timed_iter('io', raw_records)
+
+        for (recordnum, raw_record) in enumerate(raw_records, start):
+            filename = self.get_folder_path(recordnum) if filenames is None else filenames[recordnum - start]
+            if record_filter is not None and not record_filter.match_path(filename):
+                if stats is not None:
+                    stats.filtered()
+                continue
+
+            (record, raw_record) = self.timed('header', mft.parse_record_header, raw_record, self.options)
+            if stats is not None:
+                stats.count(record)
+            if record_filter is not None and not record_filter.match_header(record):
+                if stats is not None:
+                    stats.filtered()
+                continue
+
+            if raw_record is not None:
+                self.timed('attributes', mft.parse_record_attributes, record, raw_record, self.options)
+            if record_filter is not None and not record_filter.match_times(record):
+                if stats is not None:
+                    stats.filtered()
+                continue
+
+            record.filename = filename
+            yield recordnum, record
+
+    def parallel_parse_records(self):
+        """Decode and format the whole MFT in a pool of self.options.jobs processes
+
+        Yields (position in the MFT, record, matched, formatted output, [(ADS record, formatted output), ...]) in
+        record number order. Records the filters leave out are not sent back at all, or, while the cache is being
+        filled, sent back with matched False and no output. The records themselves are only sent back from the
+        workers when they are kept in memory or cached."""
+
+        # The date formatter is a function and is set up again by each worker
+        worker_options = Values(dict((k, v) for (k, v) in vars(self.options).items() if not callable(v)))
+        # Workers read a compressed MFT from the file it was decompressed to
+        worker_options.filename = self.file_mft.name
+
+        pool = multiprocessing.Pool(self.options.jobs, _init_worker, (worker_options,))
+        try:
+            # At most window chunks are in flight, and they are collected in the order they were submitted. The
+            # paths of a chunk are worked out here, in the main thread, as it is submitted.
+            window = JOB_CHUNKS_PER_WORKER * self.options.jobs
+            pending = collections.deque()
+            starts = iter(xrange(0, self.mftsize, JOB_CHUNK_RECORDS))
+            while True:
+                for start in starts:
+                    stop = min(start + JOB_CHUNK_RECORDS, self.mftsize)
+                    filenames = [self.get_folder_path(i) for i in xrange(start, stop)]
+                    pending.append(pool.apply_async(_decode_chunk, ((start, filenames),)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+
+                (results, state) = pending.popleft().get()
+                if state is not None:
+                    self.stats.merge(state)
+                for result in results:
+                    yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
 
-            raw_record = self.file_mft.read(1024)
+    def ads_records(self, record):
+        """Return a copy of the record for each of its alternate data streams"""
 
-    def do_output(self, record):
-        
-        
-        if self.options.inmemory:
-            self.fullmft[self.num_records] = record
+        ads = []
+        for i in range(0, record.ads):
+            #                         print "ADS: %s" % (record['data_name', i])
+            record_ads = record.copy()
+            record_ads.filename = record.filename + ':' + record.data_names[i]
+            ads.append(record_ads)
+
+        return ads
+
+    def format_output(self, record):
+        """Return the (CSV, JSON, l2t, bodyfile, columnar) output for a record. Disabled outputs are None."""
+
+        csv_row = json_line = l2t_str = body_str = column_row = None
 
         if self.options.output is not None:
-            self.file_csv.writerow(mft.mft_to_csv(record, False, self.options))
-        
-        if self.options.json is not None:    
-            with open(self.options.json, 'a') as outfile:
-                json.dump(mft.mft_to_json(record), outfile)
-                outfile.write('\n')
-            
-        
- 
-    
-            
+            csv_row = self.timed('csv', mft.mft_to_csv, record, False, self.options)
+
+        if self.options.json is not None:
+            json_line = self.timed('json', self.json_line, record)
+
         if self.options.csvtimefile is not None:
-            self.file_csv_time.write(mft.mft_to_l2t(record))
+            l2t_str = self.timed('l2t', mft.mft_to_l2t, record)
 
         if self.options.bodyfile is not None:
-            self.file_body.write(mft.mft_to_body(record, self.options.bodyfull, self.options.bodystd))
+            body_str = self.timed('body', mft.mft_to_body, record, self.options.bodyfull, self.options.bodystd)
 
-        if self.options.progress:
-            if self.num_records % (self.mftsize / 5) == 0 and self.num_records > 0:
-                print 'Building MFT: {0:.0f}'.format(100.0 * self.num_records / self.mftsize) + '%'
+        if self.options.columnar is not None:
+            column_row = self.timed('columnar', mftcolumns.record_to_row, record)
 
-    def plaso_process_mft_file(self):
+        return csv_row, json_line, l2t_str, body_str, column_row
 
-        # TODO - Add ADS support ....
+    @staticmethod
+    def json_line(record):
+        return json.dumps(mft.mft_to_json(record)) + '\n'
 
-        self.build_filepaths()
+    def do_output(self, record, formatted=None):
 
-        # reset the file reading
-        self.num_records = 0
-        self.file_mft.seek(0)
-        raw_record = self.file_mft.read(1024)
+        if self.options.inmemory:
+            self.fullmft[self.num_records] = record
 
-        while raw_record != "":
-            record = mft.parse_record(raw_record, self.options)
-            if self.options.debug:
-                print record
+        if self.pipeline is not None:
+            self.pipeline.put(record, formatted)
+            if self.stats is not None:
+                self.stats.report('Building MFT', self.num_records)
+            return
 
-            record['filename'] = self.mft[self.num_records]['filename']
+        if formatted is None:
+            formatted = self.format_output(record)
+        (csv_row, json_line, l2t_str, body_str, column_row) = formatted
 
-            self.fullmft[self.num_records] = record
+        if csv_row is not None:
+            self.timed('csv', self.file_csv.writerow, csv_row)
 
-            self.num_records += 1
+        if json_line is not None:
+            self.timed('json', self.file_json.write, json_line)
 
-            raw_record = self.file_mft.read(1024)
+        if column_row is not None:
+            self.timed('columnar', self.file_columns.write, column_row)
 
-    def build_filepaths(self):
-        # reset the file reading
-        self.file_mft.seek(0)
+        if l2t_str is not None:
+            self.timed('l2t', self.file_csv_time.write, l2t_str)
+
+        if body_str is not None:
+            self.timed('body', self.file_body.write, body_str)
 
+        if self.stats is not None:
+            self.stats.report('Building MFT', self.num_records)
+
+    def plaso_process_mft_file(self):
+        """Decode the whole MFT into self.fullmft. Use iter_records to process the records without keeping them."""
+
+        # TODO - Add ADS support ....
+
+        for record in self.iter_records(ads=False):
+            self.fullmft[self.num_records] = record
+
+    def build_filepaths(self):
         self.num_records = 0
+        self.paths = mftpaths.PathTable(self.path_sep)
 
-        # 1024 is valid for current version of Windows but should really get this value from somewhere
-        raw_record = self.file_mft.read(1024)
-        while raw_record != "":
-            minirec = {}
-            record = mft.parse_record(raw_record, self.options)
+        for raw_record in self.reader.records():
+            record = mft.parse_path_record(raw_record)
             if self.options.debug:
                 print record
 
-            minirec['filename'] = record['filename']
-            minirec['fncnt'] = record['fncnt']
-            if record['fncnt'] == 1:
-                minirec['par_ref'] = record['fn', 0]['par_ref']
-                minirec['name'] = record['fn', 0]['name']
-            if record['fncnt'] > 1:
-                minirec['par_ref'] = record['fn', 0]['par_ref']
-                for i in (0, record['fncnt'] - 1):
-                    # print record['fn',i]
-                    if record['fn', i]['nspace'] == 0x1 or record['fn', i]['nspace'] == 0x3:
-                        minirec['name'] = record['fn', i]['name']
-                if minirec.get('name') is None:
-                    minirec['name'] = record['fn', record['fncnt'] - 1]['name']
-
-            self.mft[self.num_records] = minirec
-
-            if self.options.progress:
-                if self.num_records % (self.mftsize / 5) == 0 and self.num_records > 0:
-                    print 'Building Filepaths: {0:.0f}'.format(100.0 * self.num_records / self.mftsize) + '%'
+            (name, par_ref) = mftpaths.path_entry(record)
+            self.paths.add(name, par_ref)
 
-            self.num_records += 1
-
-            raw_record = self.file_mft.read(1024)
+            if self.stats is not None:
+                self.stats.report('Building Filepaths', self.num_records)
 
-        self.gen_filepaths()
+            self.num_records += 1
 
     def get_folder_path(self, seqnum):
+        """Return the full path of a record. Paths are worked out as they are needed, see mftpaths.PathTable."""
+        filename = self.timed('paths', self.resolve_path, seqnum)
         if self.debug:
-            print "Building Folder For Record Number (%d)" % seqnum
-
-        if seqnum not in self.mft:
-            return 'Orphan'
-
-        # If we've already figured out the path name, just return it
-        if (self.mft[seqnum]['filename']) != '':
-            return self.mft[seqnum]['filename']
-
-        try:
-            # if (self.mft[seqnum]['fn',0]['par_ref'] == 0) or
-            # (self.mft[seqnum]['fn',0]['par_ref'] == 5):  # There should be no seq
-            # number 0, not sure why I had that check in place.
-            if self.mft[seqnum]['par_ref'] == 5:  # Seq number 5 is "/", root of the directory
-                self.mft[seqnum]['filename'] = self.path_sep + self.mft[seqnum]['name']
-                return self.mft[seqnum]['filename']
-        except:  # If there was an error getting the parent's sequence number, then there is no FN record
-            self.mft[seqnum]['filename'] = 'NoFNRecord'
-            return self.mft[seqnum]['filename']
-
-        # Self referential parent sequence number. The filename becomes a NoFNRecord note
-        if (self.mft[seqnum]['par_ref']) == seqnum:
-            if self.debug:
-                print "Error, self-referential, while trying to determine path for seqnum %s" % seqnum
-            self.mft[seqnum]['filename'] = 'ORPHAN' + self.path_sep + self.mft[seqnum]['name']
-            return self.mft[seqnum]['filename']
-
-        # We're not at the top of the tree and we've not hit an error
-        parentpath = self.get_folder_path((self.mft[seqnum]['par_ref']))
-        self.mft[seqnum]['filename'] = parentpath + self.path_sep + self.mft[seqnum]['name']
-
-        return self.mft[seqnum]['filename']
-
-    def gen_filepaths(self):
-
-        for i in self.mft:
-
-            #            if filename starts with / or ORPHAN, we're done.
-            #            else get filename of parent, add it to ours, and we're done.
-
-            # If we've not already calculated the full path ....
-            if (self.mft[i]['filename']) == '':
-
-                if self.mft[i]['fncnt'] > 0:
-                    self.get_folder_path(i)
-                    # self.mft[i]['filename'] = self.mft[i]['filename'] + '/' +
-                    #   self.mft[i]['fn',self.mft[i]['fncnt']-1]['name']
-                    # self.mft[i]['filename'] = self.mft[i]['filename'].replace('//','/')
-                    if self.debug:
-                        print "Filename (with path): %s" % self.mft[i]['filename']
-                else:
-                    self.mft[i]['filename'] = 'NoFNRecord'
+            print "Filename (with path): %s" % filename
+
+        return filename
+
+    # Random access to single records, for use as a library:
+    #
+    #     session = mftsession.MftSession()
+    #     session.mft_options(['-f', '/cases/mft.bin'])
+    #     session.open_files()
+    #     record = session.get_record(session.find('/Windows/notepad.exe'))
+    #
+    # Only the records asked for, and their parent chains, are decoded.
+
+    def get_record(self, recordnum):
+        """Decode and return record recordnum, with its full path in record.filename"""
+
+        record = self.records.get(recordnum)
+        if record is None:
+            record = mft.parse_record(self.reader.record(recordnum), self.options)
+            record.filename = self.resolve_path(recordnum)
+            self.records[recordnum] = record
+
+        return record
+
+    def resolve_path(self, recordnum):
+        """Return the full path of record recordnum"""
+
+        if self.paths is None:
+            self.paths = mftpaths.LazyPathTable(self.reader, self.path_sep, LOOKUP_CACHE_RECORDS)
+
+        return self.paths.resolve(recordnum)
+
+    def find(self, path):
+        """Return the number of the record at path, such as /Windows/notepad.exe, or None if there is none
+
+        Any of the record's names can be used, including short 8.3 names and hard links, as well as the path
+        resolve_path gives the record. The first call reads the names of every record, with parse_path_record,
+        to build an index of the directory tree."""
+
+        if self.names is None:
+            self.names = {}
+            for (recordnum, raw_record) in enumerate(self.reader.records()):
+                record = mft.parse_path_record(raw_record)
+                if record.fncnt == 0:
+                    continue
+                keys = [(record.fn_attrs[i]['par_ref'], record.fn_attrs[i]['name']) for i in range(record.fncnt)]
+                # resolve_path can pair the name of one $FILE_NAME attribute with the parent of another
+                keys.append(mftpaths.path_entry(record)[::-1])
+                for key in keys:
+                    if key not in self.names:
+                        self.names[key] = recordnum
+
+        recordnum = mftpaths.ROOT_RECORD
+        for name in path.split(self.path_sep):
+            if name == '':
+                continue
+            recordnum = self.names.get((recordnum, name))
+            if recordnum is None:
+                return None
+
+        return recordnum
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+# Name: mftstats.py
+#
+# Run statistics: the time spent in each stage of decoding and output, records and bytes per second, and counts
+# of damaged records. Reported as a progress line on stderr every few seconds and as a JSON summary at the end.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import json
+import sys
+from timeit import default_timer as clock
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# io             reading raw records from the MFT file
+# header         decoding record headers and applying the update sequence fixup
+# attributes     decoding attributes and the anomaly checks
+# paths          building the path table and working out the full path of each record
+# cache          reading and writing the --cache database
+# csv ... columnar   formatting and writing each output
+STAGES = ('io', 'header', 'attributes', 'paths', 'cache', 'csv', 'json', 'l2t', 'body', 'columnar')
+
+COUNTS = ('records', 'bytes', 'baad', 'corrupt', 'fixup_failed', 'filtered')
+
+
+class Stats:
+    """Time spent per stage and counts of the records decoded in a run
+
+    Stage times are totals over all processes: with worker processes they can add up to more than the wall
+    clock time of the run."""
+
+    def __init__(self, record_size, total=0, progress=False, out=sys.stderr):
+        self.record_size = record_size
+        self.total = total
+        self.progress = progress
+        self.out = out
+        self.times = dict((stage, 0.0) for stage in STAGES)
+        self.counts = dict((name, 0) for name in COUNTS)
+        self.start = clock()
+        self.last_report = self.start
+
+    def add(self, stage, seconds):
+        self.times[stage] += seconds
+
+    def timed(self, stage, func, *args):
+        """Call func(*args), adding the time it takes to stage, and return its result"""
+        start = clock()
+        result = func(*args)
+        self.times[stage] += clock() - start
+        return result
+
+    def timed_iter(self, stage, iterable):
+        """Yield the items of iterable, adding the time taken to produce each one to stage"""
+        items = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(items)
+            finally:
+                self.times[stage] += clock() - start
+            yield item
+
+    def count(self, record):
+        """Count a decoded record"""
+        counts = self.counts
+        counts['records'] += 1
+        counts['bytes'] += self.record_size
+        if hasattr(record, 'baad'):
+            counts['baad'] += 1
+        elif hasattr(record, 'corrupt'):
+            counts['corrupt'] += 1
+        elif hasattr(record, 'fixup_failed'):
+            counts['fixup_failed'] += 1
+
+    def filtered(self):
+        """Count a record left out by the filters"""
+        self.counts['filtered'] += 1
+
+    def state(self):
+        """Return the times and counts, to be added to another Stats with merge"""
+        return self.times, self.counts
+
+    def merge(self, state):
+        (times, counts) = state
+        for (stage, seconds) in times.items():
+            self.times[stage] += seconds
+        for (name, count) in counts.items():
+            self.counts[name] += count
+
+    def report(self, phase, done):
+        """Write a progress line if it is time for one. done is how many of the total records phase has reached."""
+
+        if not self.progress:
+            return
+
+        now = clock()
+        if now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+
+        elapsed = now - self.start
+        line = '%s: %d' % (phase, done)
+        if self.total > 0:
+            line += '/%d records (%.0f%%)' % (self.total, 100.0 * done / self.total)
+        else:
+            line += ' records'
+        line += ', %.0f records/s, %.1f MB/s, %d BAAD, %d corrupt, %d fixup failed' % (
+            self.counts['records'] / elapsed, self.counts['bytes'] / elapsed / (1024 * 1024), self.counts['baad'],
+            self.counts['corrupt'], self.counts['fixup_failed'])
+
+        self.out.write(line + '\n')
+        self.out.flush()
+
+    def summary(self):
+        """Return the statistics of the run so far as a dict"""
+
+        elapsed = clock() - self.start
+        summary = dict(self.counts)
+        summary.update({
+            'seconds': elapsed,
+            'records_per_sec': self.counts['records'] / elapsed if elapsed > 0 else 0.0,
+            'bytes_per_sec': self.counts['bytes'] / elapsed if elapsed > 0 else 0.0,
+            'stages': self.times,
+        })
+        return summary
+
+    def write_summary(self, outfile):
+        json.dump(self.summary(), outfile, indent=1, sort_keys=True)
+        outfile.write('\n')
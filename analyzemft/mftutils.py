@@ -1,47 +1,203 @@
+import sys
+from collections import OrderedDict
 from datetime import datetime
 
 
 # DevelNote: need to pass in localtz now
 
-class WindowsTime:
-    """Convert the Windows time in 100 nanosecond intervals since Jan 1, 1601 to time in seconds since Jan 1, 1970"""
+# Unix times in [0, UNIX_TIME_SAFE_MAX) always convert to a datetime, with or without the local timezone. Outside
+# that range the conversion may fail (year 10000 and beyond, negative times on some platforms), so the datetime is
+# built to find out whether the timestamp is valid.
+UNIX_TIME_SAFE_MAX = 253402300800 - 2 * 86400
+
+# FILETIME of the Unix epoch, Jan 1, 1970, in 100 nanosecond intervals since Jan 1, 1601
+EPOCH_FILETIME = 116444736000000000
+
+# Seconds between Jan 1, 1601 and Jan 1, 1970
+EPOCH_SECONDS = EPOCH_FILETIME // 10000000
+
+# The times of $STANDARD_INFORMATION and $FILE_NAME, in the order they are stored
+TIME_FIELDS = ('crtime', 'mtime', 'ctime', 'atime')
+
+
+class WindowsTime(object):
+    """Convert the Windows time in 100 nanosecond intervals since Jan 1, 1601 to time in seconds since Jan 1, 1970
+
+    The conversion is lazy: only the raw FILETIME is kept, and unixtime, dt and dtstr are worked out and cached on
+    first access. Bodyfile output only needs unixtime and never builds a datetime."""
+
+    __slots__ = ('filetime', 'localtz', '_unixtime', '_dt', '_dtstr')
 
     def __init__(self, low, high, localtz):
-        self.low = long(low)
-        self.high = long(high)
+        self.filetime = (long(high) << 32) | long(low)
+        self.localtz = localtz
+
+    def __reduce__(self):
+        return WindowsTime, (self.low, self.high, self.localtz)
+
+    @classmethod
+    def from_filetime(cls, filetime, localtz):
+        """Return the WindowsTime of a whole 64 bit FILETIME"""
+        windows_time = object.__new__(cls)
+        windows_time.filetime = filetime
+        windows_time.localtz = localtz
+        return windows_time
+
+    @property
+    def low(self):
+        return self.filetime & 0xffffffff
+
+    @property
+    def high(self):
+        return self.filetime >> 32
+
+    @property
+    def unixtime(self):
+        try:
+            return self._unixtime
+        except AttributeError:
+            pass
+
+        if self.filetime == 0:
+            self._unixtime = 0
+        else:
+            unixtime = self.get_unix_time()
+            if 0 <= unixtime < UNIX_TIME_SAFE_MAX:
+                self._unixtime = unixtime
+            else:
+                self._convert()
+
+        return self._unixtime
+
+    @property
+    def dt(self):
+        try:
+            return self._dt
+        except AttributeError:
+            self._convert()
+            return self._dt
+
+    @property
+    def dtstr(self):
+        try:
+            return self._dtstr
+        except AttributeError:
+            self._convert()
+            return self._dtstr
 
-        if (low == 0) and (high == 0):
-            self.dt = 0
-            self.dtstr = "Not defined"
-            self.unixtime = 0
+    def _convert(self):
+        if self.filetime == 0:
+            self._dt = 0
+            self._dtstr = "Not defined"
+            self._unixtime = 0
             return
 
         # Windows NT time is specified as the number of 100 nanosecond intervals since January 1, 1601.
         # UNIX time is specified as the number of seconds since January 1, 1970.
         # There are 134,774 days (or 11,644,473,600 seconds) between these dates.
-        self.unixtime = self.get_unix_time()
+        unixtime = self.get_unix_time()
 
         try:
-            if localtz:
-                self.dt = datetime.fromtimestamp(self.unixtime)
+            if self.localtz:
+                self._dt = datetime.fromtimestamp(unixtime)
             else:
-                self.dt = datetime.utcfromtimestamp(self.unixtime)
+                self._dt = datetime.utcfromtimestamp(unixtime)
 
             # Pass isoformat a delimiter if you don't like the default "T".
-            self.dtstr = self.dt.isoformat(' ')
+            self._dtstr = self._dt.isoformat(' ')
+            self._unixtime = unixtime
 
         except:
-            self.dt = 0
-            self.dtstr = "Invalid timestamp"
-            self.unixtime = 0
+            self._dt = 0
+            self._dtstr = "Invalid timestamp"
+            self._unixtime = 0
 
     def get_unix_time(self):
-        t = float(self.high) * 2 ** 32 + self.low
+        t = float(self.filetime)
 
         # The '//' does a floor on the float value, where *1e-7 does not, resulting in an off by one second error
         # However, doing the floor loses the usecs....
-        return t * 1e-7 - 11644473600
-        # return((t//10000000)-11644473600)
+        return t * 1e-7 - EPOCH_SECONDS
+        # return((t//10000000)-EPOCH_SECONDS)
+
+
+class LRUCache(object):
+    """A dict of at most maxsize items that forgets the least recently used item first
+
+    With maxbytes, the total len() of the values, such as strings, is kept to at most maxbytes as well, and a
+    value longer than that is not kept at all. Reading an item with [] or get makes it the most recently used.
+    'in' does not."""
+
+    def __init__(self, maxsize, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __getitem__(self, key):
+        value = self.items.pop(key)
+        self.items[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        if self.maxbytes is None:
+            self.items.pop(key, None)
+            self.items[key] = value
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+            return
+
+        if key in self.items:
+            self.nbytes -= len(self.items.pop(key))
+        if len(value) > self.maxbytes:
+            return
+        self.items[key] = value
+        self.nbytes += len(value)
+        while len(self.items) > self.maxsize or self.nbytes > self.maxbytes:
+            self.nbytes -= len(self.items.popitem(last=False)[1])
+
+    def clear(self):
+        self.items.clear()
+        self.nbytes = 0
+
+
+def footprint(obj):
+    """Return the approximate number of bytes used by obj and everything it refers to
+
+    Containers, arrays and the slots of __slots__ objects are followed. Objects shared within obj, and the small
+    ints and interned strings shared with the rest of the process, are counted once."""
+
+    size = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, slot) for slot in obj.__slots__ if hasattr(obj, slot))
+
+    return size
 
 
 def hexdump(chars, sep, width):
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# Name: bench_decode.py
+#
+# Micro-benchmark for the record decoders: records/second for parse_path_record and parse_record on a
+# synthetic $MFT, and runs/second for unpack_dataruns on the runlists of badly fragmented files.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import os
+import random
+import sys
+import tempfile
+import time
+from optparse import OptionParser, Values
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analyzemft import mft, mftreader
+import synthmft
+
+
+def best_time(func, records, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for raw_record in records:
+            func(raw_record)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-n", "--records", dest="records", type="int", default=20000,
+                      help="number of synthetic records to decode")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                      help="report the best of REPEAT runs")
+    parser.add_option("-f", "--file", dest="filename",
+                      help="decode FILE instead of a synthetic MFT", metavar="FILE")
+    parser.add_option("--runs", dest="runs", type="int", default=300,
+                      help="runs in each runlist of the datarun benchmark")
+    (options, args) = parser.parse_args()
+
+    if options.filename is None:
+        (fd, filename) = tempfile.mkstemp(suffix='.mft')
+        with os.fdopen(fd, 'wb') as out:
+            synthmft.generate(out, options.records)
+    else:
+        filename = options.filename
+
+    parse_options = Values({'debug': False, 'localtz': False, 'anomaly': True})
+
+    with open(filename, 'rb') as file_mft:
+        reader = mftreader.open_reader(file_mft)
+        records = list(reader.records())
+
+        for (name, func) in (('parse_path_record', mft.parse_path_record),
+                             ('parse_record', lambda raw_record: mft.parse_record(raw_record, parse_options))):
+            elapsed = best_time(func, records, options.repeat)
+            print '%-18s %8d records %8.3f s %10.0f records/sec' % (name, len(records), elapsed,
+                                                                    len(records) / elapsed)
+        del records
+        reader.close()
+
+    if options.filename is None:
+        os.remove(filename)
+
+    # Runlists of files fragmented into options.runs pieces, one run in ten sparse, as found in 4096 byte records
+    rng = random.Random(1)
+    runlists = []
+    for _ in range(200):
+        runs = [(length, None if rng.random() < 0.1 else lcn)
+                for (length, lcn) in synthmft.fragmented_runs(rng, options.runs, 4096)]
+        runlists.append(synthmft.encode_runlist(runs))
+    num_runs = sum(mft.unpack_dataruns(runlist)[0] for runlist in runlists)
+
+    elapsed = best_time(mft.unpack_dataruns, runlists, options.repeat)
+    print '%-18s %8d runs    %8.3f s %10.0f runs/sec' % ('unpack_dataruns', num_runs, elapsed, num_runs / elapsed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
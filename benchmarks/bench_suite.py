@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+# Name: bench_suite.py
+#
+# Benchmark of each stage of a run over a synthetic $MFT of a given shape: build_filepaths, parse_record and each
+# output writer. Reports records/second and the peak RSS of the process so far after each stage, and compares the
+# rates against a baseline saved by an earlier run to catch regressions.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import json
+import os
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analyzemft import mft, mftsession
+import synthmft
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB, or None where it cannot be read"""
+
+    if resource is None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on Mac OS X, KB elsewhere
+    if sys.platform == 'darwin':
+        return maxrss / (1024.0 * 1024.0)
+    return maxrss / 1024.0
+
+
+def best_time(func, repeat, setup=None):
+    """Return the shortest time func takes over repeat runs. setup, when given, is called before each run, outside
+    the timing, and func is passed what it returns."""
+
+    best = None
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def run_stages(session, repeat):
+    """Yield (stage, records, seconds) for each stage, best of repeat runs
+
+    Each run of a writer gets freshly decoded records, as the times of a record are only converted, and then kept,
+    the first time a writer reads them."""
+
+    options = session.options
+    num_records = len(session.reader)
+
+    yield 'build_filepaths', num_records, best_time(session.build_filepaths, repeat)
+
+    def parse():
+        records = []
+        for (i, raw_record) in enumerate(session.reader.records()):
+            record = mft.parse_record(raw_record, options)
+            record.filename = session.get_folder_path(i)
+            records.append(record)
+        return records
+
+    yield 'parse_record', num_records, best_time(parse, repeat)
+
+    writers = (('mft_to_csv', lambda record: mft.mft_to_csv(record, False, options)),
+               ('mft_to_body', lambda record: mft.mft_to_body(record, options.bodyfull, options.bodystd)),
+               ('mft_to_l2t', mft.mft_to_l2t),
+               ('mft_to_json', lambda record: json.dumps(mft.mft_to_json(record))))
+    for (name, func) in writers:
+        yield name, num_records, best_time(lambda records: [func(record) for record in records], repeat, parse)
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-n", "--records", dest="records", type="int", default=20000,
+                      help="number of synthetic records")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                      help="report the best of REPEAT runs")
+    parser.add_option("-f", "--file", dest="filename",
+                      help="benchmark FILE instead of a synthetic MFT", metavar="FILE")
+    parser.add_option("--depth", dest="depth", type="int", default=8, help="maximum directory depth")
+    parser.add_option("--hardlinks", dest="hardlinks", type="float", default=0.05,
+                      help="fraction of files with hard links")
+    parser.add_option("--links", dest="links", type="int", default=1,
+                      help="extra $FILE_NAME attributes of a file with hard links")
+    parser.add_option("--ads", dest="ads", type="float", default=0.05,
+                      help="fraction of files with alternate data streams")
+    parser.add_option("--streams", dest="streams", type="int", default=1,
+                      help="alternate data streams of a file that has them")
+    parser.add_option("--fragmented", dest="fragmented", type="float", default=0.02,
+                      help="fraction of files with a fragmented $DATA attribute")
+    parser.add_option("--runs", dest="runs", type="int", default=40,
+                      help="number of dataruns in a fragmented $DATA attribute")
+    parser.add_option("--baad", dest="baad", type="float", default=0.001, help="fraction of BAAD records")
+    parser.add_option("--corrupt", dest="corrupt", type="float", default=0.001, help="fraction of corrupt records")
+    parser.add_option("--record-size", dest="record_size", type="int", default=synthmft.RECORD_SIZE,
+                      help="bytes per record, 1024 or 4096")
+    parser.add_option("--save-baseline", dest="save_baseline",
+                      help="save the records/second of each stage to FILE", metavar="FILE")
+    parser.add_option("--baseline", dest="baseline",
+                      help="compare against the baseline in FILE and exit with status 1 on a regression",
+                      metavar="FILE")
+    parser.add_option("--tolerance", dest="tolerance", type="float", default=10.0,
+                      help="percentage a stage may be slower than the baseline before it counts as a regression")
+    (options, args) = parser.parse_args()
+
+    baseline = None
+    if options.baseline is not None:
+        with open(options.baseline) as infile:
+            baseline = json.load(infile)
+
+    if options.filename is None:
+        (fd, filename) = tempfile.mkstemp(suffix='.mft')
+        with os.fdopen(fd, 'wb') as out:
+            synthmft.generate(out, options.records, depth=options.depth, hardlinks=options.hardlinks,
+                              ads=options.ads, fragmented=options.fragmented, runs=options.runs,
+                              baad=options.baad, corrupt=options.corrupt, record_size=options.record_size,
+                              links=options.links, streams=options.streams)
+    else:
+        filename = options.filename
+
+    session = mftsession.MftSession()
+    session.mft_options(['-f', filename, '-a'])
+    session.open_files()
+
+    results = {}
+    regressions = []
+    # The peak RSS is a running peak of the whole process, so it includes the stages before
+    print '%-16s %8s %8s %12s %9s %9s' % ('stage', 'records', 's', 'records/sec', 'cum. peak', 'baseline')
+    for (stage, num_records, elapsed) in run_stages(session, options.repeat):
+        rate = num_records / elapsed
+        results[stage] = rate
+
+        rss = peak_rss_mb()
+        line = '%-16s %8d %8.3f %12.0f %9s' % (stage, num_records, elapsed, rate,
+                                               '-' if rss is None else '%.0f' % rss)
+        if baseline is not None and stage in baseline:
+            change = 100.0 * (rate - baseline[stage]) / baseline[stage]
+            line += ' %+8.1f%%' % change
+            if change < -options.tolerance:
+                regressions.append(stage)
+                line += ' REGRESSION'
+        print line
+
+    session.close_files()
+    session.reader.close()
+    session.file_mft.close()
+    if options.filename is None:
+        os.remove(filename)
+
+    if options.save_baseline is not None:
+        with open(options.save_baseline, 'w') as outfile:
+            json.dump(results, outfile, indent=1, sort_keys=True, separators=(',', ': '))
+            outfile.write('\n')
+
+    if regressions:
+        print 'Slower than the baseline by more than %.0f%%: %s' % (options.tolerance, ', '.join(regressions))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+
+# Name: synthmft.py
+#
+# Generate synthetic $MFT files for benchmarking. The records are well formed enough for analyzeMFT to decode
+# them completely: update sequence fixups, $STANDARD_INFORMATION, $FILE_NAME, resident and non-resident $DATA,
+# named $DATA streams (ADS) and an index root for directories. With --image, the MFT is written inside a
+# minimal NTFS volume image instead, in fragments scattered over the volume.
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import random
+import struct
+import sys
+from cStringIO import StringIO
+from optparse import OptionParser
+
+RECORD_SIZE = 1024
+SECTOR_SIZE = 512
+CLUSTER_SIZE = 4096
+
+# FILETIMEs between 1997 and 2022
+FILETIME_MIN = 125000000000000000
+FILETIME_MAX = 133000000000000000
+
+
+def resident_attribute(atype, content, name=u'', attr_id=0):
+    name_bytes = name.encode('utf-16-le')
+    content_off = (24 + len(name_bytes) + 7) & ~7
+    length = (content_off + len(content) + 7) & ~7
+
+    attribute = struct.pack('<LLBBHHHLHBB', atype, length, 0, len(name), 24 if name else 0, 0, attr_id,
+                            len(content), content_off, 0, 0) + name_bytes
+    attribute += '\x00' * (content_off - len(attribute)) + content
+
+    return attribute + '\x00' * (length - len(attribute))
+
+
+def nonresident_attribute(atype, runs, attr_id=0, cluster_size=4096, size=None):
+    runlist = encode_runlist(runs)
+    length = (64 + len(runlist) + 7) & ~7
+    clusters = sum(run_length for (run_length, _) in runs)
+    if size is None:
+        size = clusters * cluster_size
+
+    attribute = struct.pack('<LLBBHHHQQHHLQQQ', atype, length, 1, 0, 0, 0, attr_id, 0, clusters - 1, 64, 0, 0,
+                            clusters * cluster_size, size, size) + runlist
+
+    return attribute + '\x00' * (length - len(attribute))
+
+
+def encode_runlist(runs):
+    """Encode a list of (length, lcn) runs as a NTFS runlist. A lcn of None is a sparse run."""
+
+    runlist = ''
+    prev_lcn = 0
+    for (run_length, lcn) in runs:
+        length_bytes = _le_bytes(run_length, False)
+        if lcn is None:
+            offset_bytes = ''
+        else:
+            offset_bytes = _le_bytes(lcn - prev_lcn, True)
+            prev_lcn = lcn
+        runlist += chr((len(offset_bytes) << 4) | len(length_bytes)) + length_bytes + offset_bytes
+
+    return runlist + '\x00'
+
+
+def _le_bytes(value, signed):
+    # Shortest little endian encoding of value
+    for n in range(1, 9):
+        limit = 1 << (8 * n - 1)
+        if (-limit if signed else 0) <= value < limit:
+            return struct.pack('<q', value)[:n]
+    raise ValueError('Value out of range: %d' % value)
+
+
+def si_content(rng):
+    times = [rng.randint(FILETIME_MIN, FILETIME_MAX) for _ in range(4)]
+    return struct.pack('<QQQQLLLLLLQQ', times[0], times[1], times[2], times[3], 0x20, 0, 0, 0, 0, 0x100, 0, 0)
+
+
+def fn_content(rng, par_ref, name, nspace, size):
+    times = [rng.randint(FILETIME_MIN, FILETIME_MAX) for _ in range(4)]
+    return struct.pack('<LHHQQQQqqLLBB', par_ref, 0, 1, times[0], times[1], times[2], times[3], size, size, 0x20,
+                       0, len(name), nspace) + name.encode('utf-16-le')
+
+
+def build_record(recordnum, seq, flags, attributes, usn=1, record_size=RECORD_SIZE):
+    """Build a FILE record with the update sequence fixup applied, as it is on disk"""
+
+    upd_off = 48
+    upd_cnt = record_size // SECTOR_SIZE + 1
+    attr_off = (upd_off + 2 * upd_cnt + 7) & ~7
+    body = ''.join(attributes) + struct.pack('<LL', 0xffffffff, 0)
+
+    header = struct.pack('<4sHHQHHHHLLQHHL', 'FILE', upd_off, upd_cnt, 0, seq, 1, attr_off, flags,
+                         attr_off + len(body), record_size, 0, 0, 0, recordnum)
+    record = bytearray(header + '\x00' * (attr_off - len(header)) + body)
+    if len(record) > record_size:
+        raise ValueError('Record %d does not fit in %d bytes' % (recordnum, record_size))
+    record += '\x00' * (record_size - len(record))
+
+    struct.pack_into('<H', record, upd_off, usn)
+    for i in range(1, upd_cnt):
+        sector_end = i * SECTOR_SIZE - 2
+        record[upd_off + 2 * i:upd_off + 2 * i + 2] = record[sector_end:sector_end + 2]
+        struct.pack_into('<H', record, sector_end, usn)
+
+    return str(record)
+
+
+def fragmented_runs(rng, count, record_size=RECORD_SIZE, reserved=400):
+    runs = []
+    lcn = 1000
+    for _ in range(count):
+        lcn = max(1, lcn + rng.randint(-5000, 50000))
+        runs.append((rng.randint(1, 300), lcn))
+
+    # Keep the runlist and the other attributes, reserved bytes of them, inside the record
+    while len(encode_runlist(runs)) > record_size - reserved:
+        runs.pop()
+
+    return runs
+
+
+def generate(out, num_records=10000, depth=8, fanout=8, hardlinks=0.05, ads=0.05, fragmented=0.02, runs=40,
+             baad=0.001, corrupt=0.001, seed=1, record_size=RECORD_SIZE, links=1, streams=1):
+    """Write num_records synthetic records to the file object out
+
+    depth caps the directory tree depth and roughly one record in fanout is a directory. hardlinks, ads,
+    fragmented, baad and corrupt are the fractions of records with links more $FILE_NAME attributes, streams
+    named $DATA streams (ADS), a non-resident $DATA with runs runs, a BAAD signature and no signature at all.
+    record_size is 1024, or 4096 as on some volumes with 4K sectors."""
+
+    rng = random.Random(seed)
+    # Bytes a fragmented $DATA runlist leaves for the header, $STANDARD_INFORMATION, $FILE_NAME, the $DATA
+    # attribute header, and up to 120 per hard link and 96 per stream
+    reserved = 344 + 120 * links + 96 * streams
+    dirs = [5]
+    dir_depth = {5: 0}
+
+    for recordnum in range(num_records):
+        if recordnum == 5:  # The root directory is its own parent
+            attributes = [resident_attribute(0x10, si_content(rng)),
+                          resident_attribute(0x30, fn_content(rng, 5, u'.', 3, 0), attr_id=1)]
+            out.write(build_record(recordnum, 5, 0x3, attributes, record_size=record_size))
+            continue
+
+        roll = rng.random()
+        if recordnum > 16 and roll < baad:
+            out.write('BAAD' + '\x00' * (record_size - 4))
+            continue
+        if recordnum > 16 and roll < baad + corrupt:
+            out.write('\x00' * record_size)
+            continue
+
+        parent = rng.choice(dirs)
+        is_dir = rng.random() < 1.0 / fanout and dir_depth[parent] < depth
+        if is_dir:
+            name = u'dir_%d' % recordnum
+        else:
+            name = u'file_%d.txt' % recordnum
+
+        attributes = [resident_attribute(0x10, si_content(rng)),
+                      resident_attribute(0x30, fn_content(rng, parent, name, 1, 0 if is_dir else 1234), attr_id=1)]
+
+        if rng.random() < hardlinks:
+            for link in range(links):
+                attributes.append(resident_attribute(0x30, fn_content(rng, rng.choice(dirs),
+                                                                      u'link_%d' % recordnum if link == 0 else
+                                                                      u'link_%d_%d' % (recordnum, link), 1, 1234),
+                                                     attr_id=2 + link))
+
+        if is_dir:
+            dirs.append(recordnum)
+            dir_depth[recordnum] = dir_depth[parent] + 1
+            attributes.append(resident_attribute(0x90, '\x00' * 32, u'$I30', attr_id=2 + links))
+        else:
+            if rng.random() < fragmented:
+                attributes.append(nonresident_attribute(0x80, fragmented_runs(rng, runs, record_size, reserved),
+                                                        attr_id=2 + links))
+            else:
+                attributes.append(resident_attribute(0x80, 'x' * 40, attr_id=2 + links))
+            if rng.random() < ads:
+                for stream in range(streams):
+                    attributes.append(resident_attribute(0x80, '[ZoneTransfer]\r\nZoneId=3\r\n',
+                                                         u'Zone.Identifier' if stream == 0 else u'Stream%d' % stream,
+                                                         attr_id=3 + links + stream))
+
+        out.write(build_record(recordnum, rng.randint(1, 50), 0x3 if is_dir else 0x1, attributes,
+                               record_size=record_size))
+
+
+def boot_sector(total_clusters, mft_lcn, record_size=RECORD_SIZE, cluster_size=CLUSTER_SIZE):
+    """Build an NTFS boot sector with just the fields needed to find the MFT"""
+
+    # Clusters per record, or minus the log2 of the record size when a record is smaller than a cluster
+    if record_size < cluster_size:
+        clusters_per_record = -(record_size.bit_length() - 1)
+    else:
+        clusters_per_record = record_size // cluster_size
+
+    sector = struct.pack('<3s8sHB7xB18xQQQb', '\xeb\x52\x90', 'NTFS    ', SECTOR_SIZE, cluster_size // SECTOR_SIZE,
+                         0xf8, total_clusters * (cluster_size // SECTOR_SIZE), mft_lcn, mft_lcn, clusters_per_record)
+    return sector + '\x00' * (SECTOR_SIZE - 2 - len(sector)) + '\x55\xaa'
+
+
+def generate_image(out, mft_data, fragments=8, seed=1, record_size=RECORD_SIZE, cluster_size=CLUSTER_SIZE,
+                   size=None):
+    """Write a NTFS volume image to the file object out, holding the MFT mft_data in fragments runs
+
+    Record 0 is replaced with a $MFT record whose $DATA runlist points at the fragments. They are laid out in
+    reverse order with gaps between them, so only the runlist gives the right order. size is the data size the
+    $DATA attribute gives, by default the size of mft_data. Nothing else on the volume is filled in."""
+
+    rng = random.Random(seed)
+    clusters = (len(mft_data) + cluster_size - 1) // cluster_size
+    fragments = max(1, min(fragments, clusters))
+
+    # Split the clusters into fragments runs, and place them from the end of the volume backwards
+    bounds = sorted(rng.sample(range(1, clusters), fragments - 1)) if fragments > 1 else []
+    lengths = [end - start for (start, end) in zip([0] + bounds, bounds + [clusters])]
+    runs = []
+    lcn = 16
+    for length in reversed(lengths):
+        lcn += rng.randint(1, 64)
+        runs.insert(0, (length, lcn))
+        lcn += length
+    total_clusters = lcn + 16
+
+    attributes = [resident_attribute(0x10, si_content(rng)),
+                  resident_attribute(0x30, fn_content(rng, 5, u'$MFT', 3, len(mft_data)), attr_id=1),
+                  nonresident_attribute(0x80, runs, attr_id=2, cluster_size=cluster_size,
+                                        size=len(mft_data) if size is None else size)]
+    mft_data = build_record(0, 1, 0x1, attributes, record_size=record_size) + mft_data[record_size:]
+
+    out.write(boot_sector(total_clusters, runs[0][1], record_size, cluster_size))
+
+    start = 0
+    for (length, lcn) in runs:
+        out.seek(lcn * cluster_size)
+        out.write(mft_data[start:start + length * cluster_size])
+        start += length * cluster_size
+
+    out.seek(total_clusters * cluster_size - 1)
+    out.write('\x00')
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] OUTPUT")
+    parser.add_option("-n", "--records", dest="records", type="int", default=10000,
+                      help="number of records to generate")
+    parser.add_option("--depth", dest="depth", type="int", default=8, help="maximum directory depth")
+    parser.add_option("--fanout", dest="fanout", type="int", default=8,
+                      help="about one record in FANOUT is a directory")
+    parser.add_option("--hardlinks", dest="hardlinks", type="float", default=0.05,
+                      help="fraction of files with hard links, more $FILE_NAME attributes")
+    parser.add_option("--links", dest="links", type="int", default=1,
+                      help="extra $FILE_NAME attributes of a file with hard links")
+    parser.add_option("--ads", dest="ads", type="float", default=0.05,
+                      help="fraction of files with alternate data streams")
+    parser.add_option("--streams", dest="streams", type="int", default=1,
+                      help="alternate data streams of a file that has them")
+    parser.add_option("--fragmented", dest="fragmented", type="float", default=0.02,
+                      help="fraction of files with a non-resident, fragmented $DATA attribute")
+    parser.add_option("--runs", dest="runs", type="int", default=40,
+                      help="number of dataruns in a fragmented $DATA attribute")
+    parser.add_option("--baad", dest="baad", type="float", default=0.001, help="fraction of BAAD records")
+    parser.add_option("--corrupt", dest="corrupt", type="float", default=0.001, help="fraction of corrupt records")
+    parser.add_option("--seed", dest="seed", type="int", default=1, help="random seed")
+    parser.add_option("--record-size", dest="record_size", type="int", default=RECORD_SIZE,
+                      help="bytes per record, 1024 or 4096")
+    parser.add_option("--image", dest="image", type="int",
+                      help="write a NTFS volume image with the MFT in FRAGMENTS runs instead of a bare MFT",
+                      metavar="FRAGMENTS")
+
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("OUTPUT is required")
+
+    with open(args[0], 'wb') as out:
+        mft_out = StringIO() if options.image is not None else out
+        generate(mft_out, options.records, options.depth, options.fanout, options.hardlinks, options.ads,
+                 options.fragmented, options.runs, options.baad, options.corrupt, options.seed, options.record_size,
+                 options.links, options.streams)
+        if options.image is not None:
+            generate_image(out, mft_out.getvalue(), options.image, options.seed, options.record_size)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,7 @@ from distutils.core import setup
 
 setup(
     name='analyzeMFT',
-    version='2.0.19',
+    version='2.0.20',
     author='David Kovar',
     author_email='dkovar@gmail.com',
     packages=['analyzemft'],
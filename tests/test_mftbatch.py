@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# Name: test_mftbatch.py
+#
+# Tests of the NumPy batch decoder against the per-record decoder
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from analyzemft import mftbatch, mftsession, mftutils
+import synthmft
+
+
+@unittest.skipUnless(mftbatch.available(), 'NumPy is not installed')
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.filename = os.path.join(self.tmpdir, 'mft.bin')
+        with open(self.filename, 'wb') as out:
+            synthmft.generate(out, 2000, ads=0.1, baad=0.01, corrupt=0.01)
+
+    def bodyfile(self, *args):
+        """Return the bodyfile written for the synthetic MFT with the options args"""
+
+        output = os.path.join(self.tmpdir, 'body.txt')
+        session = mftsession.MftSession()
+        session.mft_options(['-f', self.filename, '-b', output] + list(args))
+        session.open_files()
+        try:
+            session.process_mft_file()
+        finally:
+            session.close_files()
+            session.reader.close()
+            session.file_mft.close()
+
+        with open(output) as infile:
+            return infile.read()
+
+    def test_filetime_to_unix(self):
+        # Zero, before 1970, the usual range, and either side of the last time a datetime can hold
+        filetimes = [0, 1, 116444736000000000 - 10 ** 7, 131000000000000000, 2650467743990000000,
+                     2650467744000000000 + 10 ** 12, 0xffffffffffffffff]
+        unixtimes = mftbatch.filetime_to_unix(mftbatch.numpy.array(filetimes, 'u8'))
+        self.assertEqual(unixtimes.tolist(),
+                         [mftutils.WindowsTime.from_filetime(filetime, False).unixtime for filetime in filetimes])
+
+    def test_bodyfile(self):
+        for args in ([], ['--bodyfull'], ['--bodystd'], ['--bodyfull', '--bodystd']):
+            # --pipeline always writes the bodyfile from records decoded one by one
+            self.assertEqual(self.bodyfile(*args), self.bodyfile('--pipeline', *args))
+
+
+if __name__ == '__main__':
+    unittest.main()
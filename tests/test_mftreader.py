@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+# Name: test_mftreader.py
+#
+# Tests of the MFT readers, on synthetic MFTs and volume images from benchmarks/synthmft.py
+#
+# This software is distributed under the Common Public License 1.0
+#
+
+import os
+import sys
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from analyzemft import mftreader
+import synthmft
+
+
+class ImageReaderTest(unittest.TestCase):
+
+    def image_reader(self, num_records, size=None):
+        """Return an ImageReader over a volume image of a synthetic MFT of num_records records"""
+
+        mft_data = StringIO()
+        synthmft.generate(mft_data, num_records)
+
+        file_image = tempfile.TemporaryFile()
+        self.addCleanup(file_image.close)
+        synthmft.generate_image(file_image, mft_data.getvalue(), size=size)
+        file_image.flush()
+
+        return mftreader.ImageReader(file_image)
+
+    def test_records(self):
+        reader = self.image_reader(200)
+        self.assertEqual(len(reader), 200)
+        self.assertEqual(reader.record(199)[:4], 'FILE')
+
+    def test_data_size_past_4_gib(self):
+        # Only the low 32 bits of this data size would give 100 records
+        reader = self.image_reader(200, size=2 ** 32 + 100 * 1024)
+        self.assertEqual(len(reader), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()